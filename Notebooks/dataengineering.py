@@ -3,9 +3,11 @@
 # import requests
 # import pandas as pd
 # import json
+# import re
 # import numpy as np
 # from typing import Dict, List, Optional
 # import time
+# from concurrent.futures import ThreadPoolExecutor
 # from urllib.parse import urljoin
 # import warnings
 # from requests.adapters import HTTPAdapter
@@ -13,6 +15,20 @@
 
 # warnings.filterwarnings("ignore")
 
+# # one compiled alternation per list -> a single scan per text instead of one substring test per flag
+# SERVICES_RE = re.compile(r"concierge|fitness|gym|spa|pool|restaurant|dining")
+# ROOMS_RE = re.compile(r"city view|balcon|smart|tech")
+# ATTRACTIONS_RE = re.compile(r"mosque|beach|market")
+
+# PROCESSED_COLUMNS = [
+#     "hotel_id", "city_id", "hotel_name", "short_description", "city_name", "country_name",
+#     "type", "latitude", "longitude", "location_url", "created_at", "location_description",
+#     "num_services", "services_list", "has_concierge", "has_fitness", "has_spa", "has_pool",
+#     "has_restaurant", "num_room_features", "rooms_description", "has_city_views",
+#     "has_balcony", "has_smart_tech", "num_attractions", "attractions_list", "near_mosque",
+#     "near_beach", "near_market", "desc_length", "total_features"
+# ]
+
 
 # def install(package: str):
 #     subprocess.check_call([sys.executable, "-m", "pip", "install", package])
@@ -63,7 +79,8 @@
 #             print(f"Error fetching page {page}: {e}")
 #             return None
 
-#     def fetch_all_data(self, max_pages: int = None, delay: float = 0.5) -> List[Dict]:
+#     def fetch_all_data(self, max_pages: int = None, delay: float = 0.5,
+#                        max_workers: int = 8) -> List[Dict]:
 #         all_data: List[Dict] = []
 
 #         first_page = self.fetch_single_page(1, delay)
@@ -85,9 +102,10 @@
 #             elif isinstance(d, list):
 #                 all_data.extend(d)
 
-#         # collect remaining pages
-#         for page in range(2, max_pages + 1):
-#             page_data = self.fetch_single_page(page, delay)
+#         # collect remaining pages concurrently (pages are independent once last_page is known)
+#         with ThreadPoolExecutor(max_workers=max_workers) as ex:
+#             pages = list(ex.map(lambda p: self.fetch_single_page(p, delay=0), range(2, max_pages + 1)))
+#         for page, page_data in zip(range(2, max_pages + 1), pages):
 #             if page_data and "data" in page_data:
 #                 d = page_data["data"]
 #                 if isinstance(d, dict):
@@ -164,22 +182,9 @@
 #             print("No data available. Call fetch_all_data first.")
 #             return pd.DataFrame()
 
-#         rows = []
+#         # accumulate column-wise: DataFrame construction packs known lists instead of inferring N dicts
+#         cols = {k: [] for k in PROCESSED_COLUMNS}
 #         for hotel in self.raw_data:
-#             row = {
-#                 "hotel_id": hotel.get("id", ""),
-#                 "city_id": hotel.get("city_id", ""),
-#                 "hotel_name": self._extract_multilingual_text(hotel.get("name", {}), target_language),
-#                 "short_description": self._extract_multilingual_text(hotel.get("short_description", {}), target_language),
-#                 "city_name": hotel.get("city_name", ""),
-#                 "country_name": hotel.get("country_name", ""),
-#                 "type": hotel.get("type", ""),
-#                 "latitude": hotel.get("latitude", 0.0),
-#                 "longitude": hotel.get("longitude", 0.0),
-#                 "location_url": hotel.get("location", ""),
-#                 "created_at": hotel.get("created_at", "")
-#             }
-
 #             desc = hotel.get("description", {}).get(target_language, {})
 #             if not isinstance(desc, dict):
 #                 desc = {}
@@ -187,34 +192,46 @@
 #             services = desc.get("Services & Facilities", [])
 #             rooms = desc.get("Rooms", [])
 #             attractions = desc.get("Nearby Attractions", [])
-#             location_desc = " ".join(desc.get("Location", []))
-
-#             row.update({
-#                 "location_description": location_desc,
-#                 "num_services": len(services),
-#                 "services_list": "; ".join(services) if services else "",
-#                 "has_concierge": any("concierge" in s.lower() for s in services),
-#                 "has_fitness": any("fitness" in s.lower() or "gym" in s.lower() for s in services),
-#                 "has_spa": any("spa" in s.lower() for s in services),
-#                 "has_pool": any("pool" in s.lower() for s in services),
-#                 "has_restaurant": any("restaurant" in s.lower() or "dining" in s.lower() for s in services),
-#                 "num_room_features": len(rooms),
-#                 "rooms_description": "; ".join(rooms) if rooms else "",
-#                 "has_city_views": any("city view" in r.lower() for r in rooms),
-#                 "has_balcony": any("balcon" in r.lower() for r in rooms),
-#                 "has_smart_tech": any("smart" in r.lower() or "tech" in r.lower() for r in rooms),
-#                 "num_attractions": len(attractions),
-#                 "attractions_list": "; ".join(attractions) if attractions else "",
-#                 "near_mosque": any("mosque" in a.lower() for a in attractions),
-#                 "near_beach": any("beach" in a.lower() for a in attractions),
-#                 "near_market": any("market" in a.lower() for a in attractions),
-#                 "desc_length": len(self._extract_multilingual_text(hotel.get("short_description", {}), target_language))
-#             })
-
-#             row["total_features"] = row["num_services"] + row["num_room_features"] + row["num_attractions"]
-#             rows.append(row)
-
-#         self.processed_df = pd.DataFrame(rows)
+
+#             short_desc = self._extract_multilingual_text(hotel.get("short_description", {}), target_language)
+
+#             svc_found = set(SERVICES_RE.findall("\n".join(services).lower()))
+#             room_found = set(ROOMS_RE.findall("\n".join(rooms).lower()))
+#             attr_found = set(ATTRACTIONS_RE.findall("\n".join(attractions).lower()))
+
+#             cols["hotel_id"].append(hotel.get("id", ""))
+#             cols["city_id"].append(hotel.get("city_id", ""))
+#             cols["hotel_name"].append(self._extract_multilingual_text(hotel.get("name", {}), target_language))
+#             cols["short_description"].append(short_desc)
+#             cols["city_name"].append(hotel.get("city_name", ""))
+#             cols["country_name"].append(hotel.get("country_name", ""))
+#             cols["type"].append(hotel.get("type", ""))
+#             cols["latitude"].append(hotel.get("latitude", 0.0))
+#             cols["longitude"].append(hotel.get("longitude", 0.0))
+#             cols["location_url"].append(hotel.get("location", ""))
+#             cols["created_at"].append(hotel.get("created_at", ""))
+#             cols["location_description"].append(" ".join(desc.get("Location", [])))
+#             cols["num_services"].append(len(services))
+#             cols["services_list"].append("; ".join(services) if services else "")
+#             cols["has_concierge"].append("concierge" in svc_found)
+#             cols["has_fitness"].append(bool(svc_found & {"fitness", "gym"}))
+#             cols["has_spa"].append("spa" in svc_found)
+#             cols["has_pool"].append("pool" in svc_found)
+#             cols["has_restaurant"].append(bool(svc_found & {"restaurant", "dining"}))
+#             cols["num_room_features"].append(len(rooms))
+#             cols["rooms_description"].append("; ".join(rooms) if rooms else "")
+#             cols["has_city_views"].append("city view" in room_found)
+#             cols["has_balcony"].append("balcon" in room_found)
+#             cols["has_smart_tech"].append(bool(room_found & {"smart", "tech"}))
+#             cols["num_attractions"].append(len(attractions))
+#             cols["attractions_list"].append("; ".join(attractions) if attractions else "")
+#             cols["near_mosque"].append("mosque" in attr_found)
+#             cols["near_beach"].append("beach" in attr_found)
+#             cols["near_market"].append("market" in attr_found)
+#             cols["desc_length"].append(len(short_desc))
+#             cols["total_features"].append(len(services) + len(rooms) + len(attractions))
+
+#         self.processed_df = pd.DataFrame(cols, copy=False)
 
 #         self._create_price_category()
 #         self._create_location_clusters()
@@ -222,7 +239,8 @@
 
 #         return self.processed_df
 
-#     def _extract_multilingual_text(self, field, lang="en") -> str:
+#     @staticmethod
+#     def _extract_multilingual_text(field, lang="en") -> str:
 #         if isinstance(field, dict):
 #             if lang in field:
 #                 return field.get(lang, "")
@@ -256,8 +274,24 @@
 
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.parquet as pq
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# --------------------------
+# Shared HTTP session (keep-alive + retries)
+# --------------------------
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.3,
+                                         status_forcelist=[429, 500, 502, 503, 504]))
+_SESSION.mount("https://", _adapter)
+_SESSION.mount("http://", _adapter)
 
 
 # --------------------------
@@ -269,9 +303,27 @@ def normalize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     so we can save to CSV/Parquet without errors.
     """
     for col in df.columns:
-        df[col] = df[col].apply(
-            lambda x: x if isinstance(x, (str, int, float, bool, type(None))) else str(x)
-        )
+        s = df[col]
+        # numeric/bool/datetime columns can't hold dicts or lists -> skip entirely
+        if s.dtype != object:
+            continue
+        mask = s.map(lambda x: not isinstance(x, (str, int, float, bool, type(None))))
+        if mask.any():
+            df.loc[mask, col] = s[mask].map(str)
+    return df
+
+
+CATEGORICAL_COLUMNS = ("country_name", "country", "type", "lang", "city_name")
+
+
+def categorize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store highly repeated string columns as categoricals: each unique value
+    is kept once and Parquet writes them dictionary-encoded.
+    """
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
     return df
 
 
@@ -280,7 +332,7 @@ def normalize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
 # --------------------------
 def fetch_users(url="http://trekio.net/api/admin/users") -> pd.DataFrame:
     print(f"Fetching users from {url}")
-    r = requests.get(url)
+    r = _SESSION.get(url, timeout=30)
     if r.status_code != 200:
         raise Exception(f"API error {r.status_code}: {r.text}")
     
@@ -292,6 +344,7 @@ def fetch_users(url="http://trekio.net/api/admin/users") -> pd.DataFrame:
     df = pd.DataFrame(raw_items)
     df["source"] = "users"
     df = normalize_dataframe(df)
+    df = categorize_columns(df)
     print(f"✅ Users fetched: {len(df)}")
     return df
 
@@ -299,35 +352,52 @@ def fetch_users(url="http://trekio.net/api/admin/users") -> pd.DataFrame:
 # --------------------------
 # Fetch Places API (paginated)
 # --------------------------
-def fetch_places(base_url="http://trekio.net/api/get-places-data") -> pd.DataFrame:
+def _get_places_page(url, params=None) -> dict:
+    r = _SESSION.get(url, params=params, timeout=30)
+    if r.status_code != 200:
+        raise Exception(f"API error {r.status_code}: {r.text}")
+    return r.json()
+
+
+def _extract_places(data: dict) -> list:
+    raw_items = data.get("data", [])
+    if isinstance(raw_items, dict):
+        raw_items = raw_items.get("items") or list(raw_items.values())
+    if not isinstance(raw_items, list):
+        raise Exception(f"Unexpected 'data' format: {type(raw_items)}")
+    return raw_items
+
+
+def fetch_places(base_url="http://trekio.net/api/get-places-data", max_workers=8) -> pd.DataFrame:
     print(f"Fetching places from {base_url}")
 
-    all_data = []
-    url = base_url
-    page_num = 1
-
-    while url:
-        print(f"➡️ Page {page_num}: {url}")
-        r = requests.get(url)
-        if r.status_code != 200:
-            raise Exception(f"API error {r.status_code}: {r.text}")
-        
-        data = r.json()
-        raw_items = data.get("data", [])
-        if isinstance(raw_items, dict):
-            raw_items = raw_items.get("items") or list(raw_items.values())
-        if not isinstance(raw_items, list):
-            raise Exception(f"Unexpected 'data' format: {type(raw_items)}")
-
-        all_data.extend(raw_items)
-
-        # pagination
+    print(f"➡️ Page 1: {base_url}")
+    data = _get_places_page(base_url)
+    all_data = _extract_places(data)
+
+    last_page = data.get("last_page")
+    if isinstance(last_page, int) and last_page > 1:
+        # page count is known -> fetch the remaining pages concurrently (map keeps page order)
+        print(f"➡️ Pages 2-{last_page} ({max_workers} workers)")
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            pages = ex.map(lambda p: _get_places_page(base_url, {"page": p}), range(2, last_page + 1))
+            for page_data in pages:
+                all_data.extend(_extract_places(page_data))
+    else:
+        # no page count -> follow next_page_url links
         url = data.get("next_page_url")
-        page_num += 1
+        page_num = 2
+        while url:
+            print(f"➡️ Page {page_num}: {url}")
+            data = _get_places_page(url)
+            all_data.extend(_extract_places(data))
+            url = data.get("next_page_url")
+            page_num += 1
 
     df = pd.DataFrame(all_data)
     df["source"] = "places"
     df = normalize_dataframe(df)
+    df = categorize_columns(df)
     print(f"✅ Places fetched: {len(df)}")
     return df
 
@@ -338,24 +408,31 @@ def fetch_places(base_url="http://trekio.net/api/get-places-data") -> pd.DataFra
 def build_dataset(users_url="http://trekio.net/api/admin/users",
                   places_url="http://trekio.net/api/get-places-data",
                   final_csv="combined.csv",
-                  final_parquet="combined.parquet"):
+                  final_parquet="combined.parquet",
+                  write_csv=False):
     users_df = fetch_users(users_url)
     places_df = fetch_places(places_url)
 
-    # Union of columns
-    all_cols = list(set(users_df.columns).union(set(places_df.columns)))
-    users_df = users_df.reindex(columns=all_cols)
-    places_df = places_df.reindex(columns=all_cols)
+    # Share one category set per column so concat keeps the categorical dtype
+    for col in CATEGORICAL_COLUMNS:
+        if (col in users_df.columns and col in places_df.columns
+                and isinstance(users_df[col].dtype, pd.CategoricalDtype)
+                and isinstance(places_df[col].dtype, pd.CategoricalDtype)):
+            dtype = union_categoricals([users_df[col], places_df[col]]).dtype
+            users_df[col] = users_df[col].astype(dtype)
+            places_df[col] = places_df[col].astype(dtype)
 
-    # Merge
-    combined_df = pd.concat([users_df, places_df], ignore_index=True)
+    # Merge: outer concat already unions the columns, no need to reindex both inputs first
+    combined_df = pd.concat([users_df, places_df], ignore_index=True, join="outer", copy=False)
+    combined_df = combined_df.reindex(columns=sorted(combined_df.columns))
 
-    # Save
-    combined_df.to_csv(final_csv, index=False, encoding="utf-8")
-    combined_df.to_parquet(final_parquet, index=False, engine="pyarrow")
+    # Save: Parquet always (columnar + zstd), CSV only on request (slow per-cell text encoding)
+    pq.write_table(pa.Table.from_pandas(combined_df, preserve_index=False), final_parquet, compression="zstd")
+    if write_csv:
+        combined_df.to_csv(final_csv, index=False, encoding="utf-8")
 
     print(f"✅ Combined dataset built: {len(combined_df)} rows")
-    print(f"💾 Saved to {final_csv} and {final_parquet}")
+    print(f"💾 Saved to {final_parquet}" + (f" and {final_csv}" if write_csv else ""))
 
     return combined_df
 
@@ -3,8 +3,6 @@
 running command in bash first 
 pip install numpy
 pip install sentence-transformers
-pip install scikit-learn
-pip install geopy  
 python TourPlan_Recommender/Candidates.py
 """
 # tourplan_recommender/candidates.py
@@ -17,119 +15,341 @@ Helper generators only (no DB writes here):
 - popularity_candidates: simple fallback
 """
 
+import os
+import math
 import sqlite3
 import logging
-from typing import List, Dict, Any
-from geopy.distance import geodesic
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+try:
+    from ._model import get_st_model
+except ImportError:  # run as a script from TourPlan_Recommender/
+    from _model import get_st_model
+
+# Optional: FAISS HNSW index for sub-linear top-K (built by Features.py)
+try:
+    import faiss
+    HAS_FAISS = True
+except ImportError:
+    HAS_FAISS = False
+
+# Optional: numba fuses the haversine into one parallel pass, fallback to NumPy
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 DB_PATH = "poi.db"
+FAISS_INDEX_PATH = "poi.faiss"
+EARTH_RADIUS_KM = 6371.0
+# Opt-in: scan the int8 copies (vector_q8) instead of float32. Uses 4x less memory for the
+# matrix, but NumPy has no int8 GEMV kernel, so the scan is slower than float32 BLAS.
+INT8_SCAN = False
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("candidates")
 
-# ----------------- Load embedding model -----------------
-try:
-    model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2", device="cpu")
-    log.info("✅ Loaded paraphrase-multilingual MiniLM model.")
-except Exception as e:
-    log.error(f"⚠️ Failed to load sentence-transformers model: {e}")
-    model = None
+# ----------------- Load embedding model (lazy, shared with Features.py) -----------------
+def _get_model():
+    try:
+        return get_st_model()
+    except Exception as e:
+        log.error(f"⚠️ Failed to load sentence-transformers model: {e}")
+        return None
+
+# ----------------- Haversine distance -----------------
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _haversine_km(lats, lons, qlat, qlon):
+        """Distances (km) from (qlat, qlon) to every POI in a single fused loop."""
+        out = np.empty(lats.size, dtype=np.float64)
+        qlat_r = math.radians(qlat)
+        qlon_r = math.radians(qlon)
+        cos_q = math.cos(qlat_r)
+        for i in prange(lats.size):
+            lat_r = math.radians(lats[i])
+            dlat = lat_r - qlat_r
+            dlon = math.radians(lons[i]) - qlon_r
+            a = math.sin(dlat * 0.5) ** 2 + cos_q * math.cos(lat_r) * math.sin(dlon * 0.5) ** 2
+            out[i] = 2.0 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+        return out
+else:
+    def _haversine_km(lats, lons, qlat, qlon):
+        """Distances (km) from (qlat, qlon) to every POI, vectorized with NumPy."""
+        dlat = np.radians(lats - qlat)
+        dlon = np.radians(lons - qlon)
+        a = np.sin(dlat / 2) ** 2 + math.cos(math.radians(qlat)) * np.cos(np.radians(lats)) * np.sin(dlon / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+# ----------------- In-memory caches (reloaded when poi.db changes) -----------------
+_EMB_CACHE: Dict[Any, Any] = {}
+_META_CACHE: Dict[Any, Any] = {}
+_GEO_CACHE: Dict[Any, Any] = {}
+_FAISS_CACHE: Dict[Any, Any] = {}
+
+
+def _db_stamp() -> Tuple[Tuple[int, int], ...]:
+    """
+    Change marker for poi.db: (mtime_ns, size) of the main file and of its -wal file.
+    In WAL mode small writes stay in poi.db-wal, leaving the main file's mtime untouched.
+    """
+    stamp = []
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append((0, 0))
+    return tuple(stamp)
+
+
+def _load_embeddings(lang: str = "en"):
+    """
+    Return (poi_ids, matrix, scales, meta) for a language, cached until poi.db changes.
+    Matrix is L2-normalized float32 and scales is None; with INT8_SCAN and an int8 copy on
+    every row, matrix is int8 (N, D) and scales holds the per-row dequantization factors.
+    meta maps poi_id -> (city, country, type), fetched in the same JOIN as the vectors.
+    """
+    stamp = _db_stamp()
+    cached = _EMB_CACHE.get((DB_PATH, lang))
+    if cached is not None and cached[0] == stamp:
+        return cached[1:]
 
-# ----------------- Helper: enrich with metadata -----------------
-def enrich_with_metadata(poi_ids: List[int]) -> Dict[int, Dict[str, Any]]:
-    if not poi_ids:
-        return {}
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    q_marks = ",".join("?" for _ in poi_ids)
+    cur.execute("PRAGMA table_info(poi_embeddings)")
+    has_q8 = INT8_SCAN and "vector_q8" in {r[1] for r in cur.fetchall()}
+    q8_cols = "e.vector_q8, e.q_scale" if has_q8 else "NULL, NULL"
     cur.execute(f"""
-        SELECT id, city_name, country_name, type
+        SELECT e.poi_id, e.vector, {q8_cols}, p.city_name, p.country_name, p.type
+        FROM poi_embeddings e
+        LEFT JOIN pois p ON p.id = e.poi_id
+        WHERE e.lang=?
+    """, (lang,))
+    rows = cur.fetchall()
+    conn.close()
+
+    n = len(rows)
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+    scales = None
+    if rows and all(r[2] is not None for r in rows):
+        M = np.frombuffer(b"".join(r[2] for r in rows), dtype=np.int8).reshape(n, -1)
+        scales = np.fromiter((r[3] for r in rows), dtype=np.float32, count=n)
+    elif rows:
+        M = np.frombuffer(b"".join(r[1] for r in rows), dtype=np.float32).reshape(n, -1)
+        M = M / np.maximum(np.linalg.norm(M, axis=1, keepdims=True), 1e-12)
+    else:
+        M = np.empty((0, 0), dtype=np.float32)
+
+    meta = {r[0]: (r[4], r[5], r[6]) for r in rows}
+
+    _EMB_CACHE[(DB_PATH, lang)] = (stamp, ids, M, scales, meta)
+    log.info(f"Loaded {n} '{lang}' embeddings into memory ({'int8' if scales is not None else 'float32'}).")
+    return ids, M, scales, meta
+
+
+def _load_metadata() -> Dict[int, Tuple[str, str, str]]:
+    """Return {poi_id: (city, country, type)} for all POIs, cached until poi.db changes."""
+    stamp = _db_stamp()
+    cached = _META_CACHE.get(DB_PATH)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    cur.execute("SELECT id, city_name, country_name, type FROM pois")
+    meta = {r[0]: (r[1], r[2], r[3]) for r in cur.fetchall()}
+    conn.close()
+
+    _META_CACHE[DB_PATH] = (stamp, meta)
+    return meta
+
+
+def _load_coordinates() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (poi_ids, lats, lons) for POIs that have coordinates, cached until poi.db changes."""
+    stamp = _db_stamp()
+    cached = _GEO_CACHE.get(DB_PATH)
+    if cached is not None and cached[0] == stamp:
+        return cached[1], cached[2], cached[3]
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, latitude, longitude
         FROM pois
-        WHERE id IN ({q_marks})
-    """, poi_ids)
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """)
     rows = cur.fetchall()
     conn.close()
-    return {r[0]: {"city": r[1], "country": r[2], "type": r[3]} for r in rows}
+
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    lats = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+    lons = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+
+    _GEO_CACHE[DB_PATH] = (stamp, ids, lats, lons)
+    return ids, lats, lons
+
+
+def _load_faiss_index():
+    """Return the POI HNSW index (cached by file mtime), or None if faiss/the index is missing."""
+    if not HAS_FAISS or not os.path.exists(FAISS_INDEX_PATH):
+        return None
+    mtime = os.path.getmtime(FAISS_INDEX_PATH)
+    cached = _FAISS_CACHE.get(FAISS_INDEX_PATH)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    index = faiss.read_index(FAISS_INDEX_PATH)
+    _FAISS_CACHE[FAISS_INDEX_PATH] = (mtime, index)
+    log.info(f"Loaded FAISS index with {index.ntotal} vectors.")
+    return index
+
+
+# ----------------- Helper: top-k selection -----------------
+def _top_k(keys: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest keys in ascending order: O(N + k log k) partial sort."""
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(keys):
+        idx = np.argpartition(keys, k)[:k]
+    else:
+        idx = np.arange(len(keys))
+    return idx[np.argsort(keys[idx], kind="stable")]
+
+
+# ----------------- Helper: enrich with metadata -----------------
+def enrich_with_metadata(poi_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    if not poi_ids:
+        return {}
+    meta = _load_metadata()
+    out = {}
+    for poi_id in poi_ids:
+        m = meta.get(poi_id)
+        if m is not None:
+            out[poi_id] = {"city": m[0], "country": m[1], "type": m[2]}
+    return out
 
 # ----------------- Semantic candidates -----------------
+def _rank_semantic(ids: np.ndarray, sims: np.ndarray, meta: Dict[int, Tuple[str, str, str]],
+                   country: str, city: str, k: int) -> List[Dict[str, Any]]:
+    """Apply the optional country/city filters, keep the top-k by similarity and attach metadata."""
+    if country or city:
+        country_lc = country.lower() if country else None
+        city_lc = city.lower() if city else None
+        keep = np.ones(len(ids), dtype=bool)
+        for i, poi_id in enumerate(ids.tolist()):
+            m_city, m_country, _ = meta.get(poi_id, (None, None, None))
+            if country_lc and (m_country or "").lower() != country_lc:
+                keep[i] = False
+            elif city_lc and (m_city or "").lower() != city_lc:
+                keep[i] = False
+        ids, sims = ids[keep], sims[keep]
+
+    top = _top_k(-sims, k)
+    results = []
+    for i in top:
+        poi_id = int(ids[i])
+        item = {"poi_id": poi_id, "semantic": float(sims[i])}
+        m = meta.get(poi_id)
+        if m is not None:
+            item.update(city=m[0], country=m[1], type=m[2])
+        results.append(item)
+    return results
+
+
+def _ann_candidates(index, q: np.ndarray, country: str, city: str, k: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Top-K via the FAISS index. With filters we over-fetch; returns None when the
+    filtered set comes up short so the caller can fall back to the exact scan.
+    """
+    fetch = k if not (country or city) else max(k * 50, 500)
+    fetch = min(fetch, index.ntotal)
+    faiss.downcast_index(index.index).hnsw.efSearch = max(64, fetch)
+    D, I = index.search(q.reshape(1, -1).astype(np.float32), fetch)
+    found = I[0] >= 0
+    results = _rank_semantic(I[0][found].astype(np.int64), D[0][found], _load_metadata(), country, city, k)
+    if len(results) < k and fetch < index.ntotal:
+        return None
+    return results
+
+
 def get_candidates(query: str, country: str = None, city: str = None, k: int = 10) -> List[Dict[str, Any]]:
     """Return top-K semantic candidates with metadata (no DB writes)."""
+    model = _get_model()
     if model is None:
         log.warning("Model not loaded; returning empty list.")
         return []
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
     query_vec = model.encode([query])
     query_vec = np.array(query_vec, dtype=np.float32)
+    q = query_vec[0] / max(float(np.linalg.norm(query_vec[0])), 1e-12)
 
-    cur.execute("SELECT poi_id, vector FROM poi_embeddings WHERE lang='en'")
-    rows = cur.fetchall()
-    conn.close()
-
-    results = []
-    for poi_id, emb_blob in rows:
-        emb = np.frombuffer(emb_blob, dtype=np.float32)
-        sim = float(cosine_similarity(query_vec, [emb])[0][0])
-        results.append({"poi_id": poi_id, "semantic": sim})
+    # fast route: approximate nearest neighbours from the prebuilt HNSW index
+    index = _load_faiss_index()
+    if index is not None and index.ntotal:
+        results = _ann_candidates(index, q, country, city, k)
+        if results is not None:
+            return results
 
-    # enrich
-    meta = enrich_with_metadata([r["poi_id"] for r in results])
-    for r in results:
-        r.update(meta.get(r["poi_id"], {}))
+    ids, M, scales, meta = _load_embeddings("en")
+    if not len(ids):
+        return []
 
-    # optional filters
-    if country:
-        results = [r for r in results if (r.get("country") or "").lower() == country.lower()]
-    if city:
-        results = [r for r in results if (r.get("city") or "").lower() == city.lower()]
+    # rows and query are L2-normalized, so cosine similarity is a plain dot product
+    if scales is None:
+        sims = M @ q
+    else:
+        # int8 x int8 dot products accumulated in int32, then rescaled
+        q_scale = max(float(np.abs(q).max()) / 127.0, 1e-12)
+        q8 = np.round(q / q_scale).astype(np.int8)
+        sims = np.einsum("ij,j->i", M, q8, dtype=np.int32, casting="unsafe") * (scales * q_scale)
 
-    return sorted(results, key=lambda x: x["semantic"], reverse=True)[:k]
+    return _rank_semantic(ids, sims, meta, country, city, k)
 
 # ----------------- Geo candidates -----------------
 def geo_candidates(lat: float, lon: float, radius_km: float = 5.0, k: int = 10) -> List[Dict[str, Any]]:
     """Return POIs near given coordinates with metadata (no DB writes)."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, latitude, longitude, city_name, country_name, type
-        FROM pois
-        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
-    """)
-    rows = cur.fetchall()
-    conn.close()
+    ids, lats, lons = _load_coordinates()
+
+    # cheap bounding-box prefilter on latitude (1 deg ~ 111 km) before any trig
+    near = np.abs(lats - lat) <= radius_km / 111.0
+    ids, lats, lons = ids[near], lats[near], lons[near]
+
+    dist = _haversine_km(lats, lons, float(lat), float(lon))
+
+    within = dist <= radius_km
+    ids, dist = ids[within], dist[within]
+    order = _top_k(dist, k)
 
+    meta = enrich_with_metadata(ids[order].tolist())
     results = []
-    for poi_id, plat, plon, city_name, country_name, typ in rows:
-        dist = geodesic((lat, lon), (plat, plon)).km
-        if dist <= radius_km:
-            results.append({
-                "poi_id": poi_id,
-                "distance_km": dist,
-                "city": city_name,
-                "country": country_name,
-                "type": typ
-            })
-
-    return sorted(results, key=lambda x: x["distance_km"])[:k]
+    for i in order:
+        poi_id = int(ids[i])
+        results.append({"poi_id": poi_id, "distance_km": float(dist[i]), **meta.get(poi_id, {})})
+    return results
 
 # ----------------- Popularity candidates -----------------
 def popularity_candidates(k: int = 10) -> List[Dict[str, Any]]:
     """Return top-K POIs by ID order with metadata (no DB writes)."""
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    cur.execute("SELECT id FROM pois ORDER BY id ASC LIMIT ?", (k,))
+    # metadata comes back in the same query -> no second enrich_with_metadata round-trip
+    cur.execute("""
+        SELECT id, city_name, country_name, type
+        FROM pois
+        ORDER BY id ASC
+        LIMIT ?
+    """, (k,))
     rows = cur.fetchall()
     conn.close()
 
-    results = [{"poi_id": r[0], "rank": i + 1} for i, r in enumerate(rows)]
-    meta = enrich_with_metadata([r["poi_id"] for r in results])
-    for r in results:
-        r.update(meta.get(r["poi_id"], {}))
-    return results
+    return [
+        {"poi_id": poi_id, "rank": i + 1, "city": city_name, "country": country_name, "type": typ}
+        for i, (poi_id, city_name, country_name, typ) in enumerate(rows)
+    ]
 
 if __name__ == "__main__":
     log.info("🚀 Running candidates.py smoke test (no DB writes)")
@@ -6,6 +6,8 @@ and stores them in SQLite for retrieval.
 """
 import logging
 import sqlite3
+import importlib.util
+from typing import Tuple
 import pandas as pd
 import numpy as np
 
@@ -13,14 +15,23 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 logging.basicConfig(level=logging.DEBUG)
 
 # Try to use sentence-transformers (multilingual embeddings), fallback to TF-IDF
+HAS_ST = importlib.util.find_spec("sentence_transformers") is not None
+
+# Optional: FAISS HNSW index for fast top-K retrieval in Candidates.py
 try:
-    from sentence_transformers import SentenceTransformer
-    HAS_ST = True
+    import faiss
+    HAS_FAISS = True
 except ImportError:
-    HAS_ST = False
+    HAS_FAISS = False
+
+try:
+    from ._model import get_st_model
+except ImportError:  # run as a script from TourPlan_Recommender/
+    from _model import get_st_model
 
 DB_PATH = "poi.db"
 PARQUET_FILE = "poi_texts.parquet"
+FAISS_INDEX_PATH = "poi.faiss"
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("features")
@@ -48,10 +59,10 @@ def load_poi_texts() -> pd.DataFrame:
             return pd.DataFrame()
 
 # ----------------- Embeddings -----------------
-def build_embeddings(df: pd.DataFrame, lang: str = "en") -> pd.DataFrame:
+def build_embeddings(df: pd.DataFrame, lang: str = "en") -> Tuple[np.ndarray, str, np.ndarray]:
     """
     Build embeddings for POI texts in a given language.
-    Returns DataFrame with poi_id, lang, embedding (np.array).
+    Returns (poi_ids int64 (N,), lang, embeddings as one contiguous float32 (N, D) matrix).
     """
     df_lang = df[df["lang"] == lang].copy()
     texts = (
@@ -65,15 +76,16 @@ def build_embeddings(df: pd.DataFrame, lang: str = "en") -> pd.DataFrame:
     if HAS_ST:
         try:
             log.info("Using SentenceTransformer for embeddings.")
-            model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2", device="cpu")
+            model = get_st_model()
 
-            # Encode in small batches to avoid OOM
-            batch_size = 64
-            embeddings = []
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i+batch_size]
-                batch_emb = model.encode(batch, show_progress_bar=True, convert_to_numpy=True)
-                embeddings.extend(batch_emb)
+            # encode() batches internally; L2-normalized output is ready for dot-product similarity
+            embeddings = model.encode(
+                texts,
+                batch_size=64,
+                show_progress_bar=True,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
 
         except Exception as e:
             log.warning(f"SentenceTransformer failed ({e}). Falling back to TF-IDF.")
@@ -82,19 +94,36 @@ def build_embeddings(df: pd.DataFrame, lang: str = "en") -> pd.DataFrame:
     if embeddings is None:
         log.info("Using TF-IDF fallback for embeddings.")
         vectorizer = TfidfVectorizer(max_features=512)
-        embeddings = vectorizer.fit_transform(texts).toarray()
+        # cast the sparse CSR matrix to float32 before densifying: skips the float64 dense copy
+        embeddings = vectorizer.fit_transform(texts).astype(np.float32).toarray()
 
-    df_lang["embedding"] = list(embeddings)
-    return df_lang[["poi_id", "lang", "embedding"]]
+    poi_ids = df_lang["poi_id"].to_numpy().astype(np.int64)
+    return poi_ids, lang, np.ascontiguousarray(embeddings, dtype=np.float32)
+
+# ----------------- Quantization -----------------
+def quantize_int8(M: np.ndarray):
+    """
+    Per-row symmetric int8 quantization of L2-normalized vectors.
+    Returns (Q int8 (N, D), scales float32 (N,)) with M ~= Q * scales[:, None].
+    """
+    M = np.asarray(M, dtype=np.float32)
+    M = M / np.maximum(np.linalg.norm(M, axis=1, keepdims=True), 1e-12)
+    scales = np.abs(M).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    Q = np.round(M / scales[:, None]).astype(np.int8)
+    return Q, scales.astype(np.float32)
 
 # ----------------- Save to SQLite -----------------
-def save_embeddings(df_emb: pd.DataFrame):
+def save_embeddings(poi_ids: np.ndarray, lang: str, M: np.ndarray):
     """
     Save embeddings into SQLite as BLOBs.
-    Each embedding is stored as float32 bytes.
+    Each embedding is stored as float32 bytes, plus an int8 copy (vector_q8)
+    and its scale (q_scale) used by the similarity scan in Candidates.py.
     """
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS poi_embeddings (
@@ -102,19 +131,65 @@ def save_embeddings(df_emb: pd.DataFrame):
         poi_id INTEGER,
         lang TEXT,
         vector BLOB,
+        vector_q8 BLOB,
+        q_scale REAL,
         FOREIGN KEY (poi_id) REFERENCES pois(id)
     )
     """)
-
-    for _, row in df_emb.iterrows():
-        vector = np.array(row["embedding"], dtype=np.float32).tobytes()
-        cur.execute(
-            "INSERT INTO poi_embeddings (poi_id, lang, vector) VALUES (?, ?, ?)",
-            (int(row["poi_id"]), row["lang"], vector)
-        )
+    # older databases were created without the quantized columns
+    cur.execute("PRAGMA table_info(poi_embeddings)")
+    existing_cols = {r[1] for r in cur.fetchall()}
+    if "vector_q8" not in existing_cols:
+        cur.execute("ALTER TABLE poi_embeddings ADD COLUMN vector_q8 BLOB")
+    if "q_scale" not in existing_cols:
+        cur.execute("ALTER TABLE poi_embeddings ADD COLUMN q_scale REAL")
+    # covers the WHERE lang=? + JOIN on poi_id used by Candidates.py
+    cur.execute("CREATE INDEX IF NOT EXISTS poi_emb_lang ON poi_embeddings(lang, poi_id)")
+
+    M = np.ascontiguousarray(M, dtype=np.float32)
+    Q, scales = quantize_int8(M)
+    n, d = M.shape
+
+    # zero-copy row slices of the contiguous matrices; sqlite3 binds buffers as BLOBs
+    vec_buf = memoryview(M).cast("B")
+    q8_buf = memoryview(Q).cast("B")
+    vec_bytes, q8_bytes = d * M.itemsize, d * Q.itemsize
+    rows = (
+        (int(poi_ids[i]), lang,
+         vec_buf[i * vec_bytes:(i + 1) * vec_bytes],
+         q8_buf[i * q8_bytes:(i + 1) * q8_bytes],
+         float(scales[i]))
+        for i in range(n)
+    )
+    # one bulk insert inside a single transaction
+    cur.execute("BEGIN")
+    cur.executemany(
+        "INSERT INTO poi_embeddings (poi_id, lang, vector, vector_q8, q_scale) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
     conn.commit()
     conn.close()
-    log.info(f"Saved {len(df_emb)} embeddings into SQLite.")
+    log.info(f"Saved {n} embeddings into SQLite.")
+
+# ----------------- ANN index -----------------
+def build_faiss_index(poi_ids: np.ndarray, M: np.ndarray, path: str = FAISS_INDEX_PATH):
+    """
+    Build an HNSW inner-product index over the L2-normalized embeddings,
+    keyed by poi_id, and persist it for Candidates.get_candidates.
+    """
+    if not HAS_FAISS:
+        log.info("faiss not installed; skipping ANN index (Candidates will use the linear scan).")
+        return
+    M = np.asarray(M, dtype=np.float32)
+    M = M / np.maximum(np.linalg.norm(M, axis=1, keepdims=True), 1e-12)
+    ids = np.asarray(poi_ids, dtype=np.int64)
+
+    hnsw = faiss.IndexHNSWFlat(M.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+    hnsw.hnsw.efConstruction = 80
+    index = faiss.IndexIDMap(hnsw)
+    index.add_with_ids(M, ids)
+    faiss.write_index(index, path)
+    log.info(f"Saved FAISS HNSW index with {index.ntotal} vectors to {path}.")
 
 # ----------------- Main -----------------
 def main():
@@ -122,8 +197,9 @@ def main():
     if df.empty:
         log.warning("No data found. Run ingest.py first.")
         return
-    df_emb = build_embeddings(df, lang="en")  # Default language = English
-    save_embeddings(df_emb)
+    poi_ids, lang, M = build_embeddings(df, lang="en")  # Default language = English
+    save_embeddings(poi_ids, lang, M)
+    build_faiss_index(poi_ids, M)
 
 if __name__ == "__main__":
     main()
@@ -8,48 +8,100 @@ Scoring & reranking logic for POI candidates.
 
 import sqlite3
 import logging
-from typing import List, Dict, Any
-from math import isfinite
+import atexit
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# Optional: numba compiles the per-candidate scoring loop, fallback to NumPy
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 # ----------------- Config -----------------
 DB_PATH = "poi.db"
 
+# single INSERT statement text, so sqlite3's statement cache reuses one prepared statement
+_INSERT_SQL = """
+INSERT INTO scored_candidates
+(poi_id, city, country, type, semantic, distance, category_score, diversity_score, final_score, explanation)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("models")
 
 
 # ----------------- Helper functions -----------------
-def normalize_score(value: float, min_val: float, max_val: float) -> float:
-    """Normalize a score into [0,1] range with guardrails."""
-    try:
-        if max_val == min_val:
-            return 0.5  # neutral if no spread
-        if not isfinite(value):
-            return 0.0
-        return (value - min_val) / (max_val - min_val)
-    except Exception:
-        return 0.0
+def normalize_scores(values: np.ndarray, min_val: float, max_val: float) -> np.ndarray:
+    """Normalize scores into [0,1] range: 0.5 if no spread (neutral), 0.0 for non-finite values."""
+    rng = max_val - min_val
+    out = np.where(rng > 0, (values - min_val) / max(rng, 1e-12), 0.5)
+    return np.nan_to_num(out, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+# ----------------- Scoring kernel -----------------
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _score_kernel(sem_n, dist_n, cats, is_interest, w_sem, w_dist, w_cat, w_div):
+        """
+        Category, diversity and final scores in one loop.
+        cats: int category codes (-1 = no type); is_interest[code]: type matches a user interest.
+        """
+        n = cats.size
+        cat_score = np.zeros(n)
+        div_score = np.zeros(n)
+        final = np.empty(n)
+        counts = np.zeros(is_interest.size, dtype=np.int64)
+        for i in range(n):
+            c = cats[i]
+            if c >= 0:
+                if is_interest[c]:
+                    cat_score[i] = 1.0
+                div_score[i] = -0.2 * counts[c]
+                counts[c] += 1
+            final[i] = w_sem * sem_n[i] + w_dist * dist_n[i] + w_cat * cat_score[i] + w_div * div_score[i]
+        return cat_score, div_score, final
+else:
+    def _score_kernel(sem_n, dist_n, cats, is_interest, w_sem, w_dist, w_cat, w_div):
+        """Category, diversity and final scores, vectorized with NumPy."""
+        n = cats.size
+        valid = cats >= 0
+        cat_score = np.zeros(n)
+        cat_score[valid] = is_interest[cats[valid]]
+        # diversity: number of earlier candidates with the same code = rank inside its stable-sorted group
+        order = np.argsort(cats, kind="stable")
+        group_start = np.r_[0, np.flatnonzero(np.diff(cats[order])) + 1]
+        seen = np.empty(n)
+        seen[order] = np.arange(n) - np.repeat(group_start, np.diff(np.r_[group_start, n]))
+        div_score = np.where(valid, -0.2 * seen, 0.0)
+        final = w_sem * sem_n + w_dist * dist_n + w_cat * cat_score + w_div * div_score
+        return cat_score, div_score, final
 
 
-def category_match(poi_type: str, user_interests: List[str]) -> float:
-    """Return 1.0 if POI type matches user interests, else 0."""
-    if not poi_type or not user_interests:
-        return 0.0
-    return 1.0 if poi_type.lower() in [x.lower() for x in user_interests] else 0.0
-
-
-def diversity_penalty(selected: List[Dict], current_cat: str) -> float:
-    """Apply penalty if too many POIs of the same category already selected."""
-    if not current_cat:
-        return 0.0
-    count_same = sum(1 for c in selected if (c.get("type") or "").lower() == current_cat.lower())
-    return -0.2 * count_same
+# ----------------- SQLite setup -----------------
+@lru_cache(maxsize=1)
+def _get_conn() -> sqlite3.Connection:
+    """
+    Shared connection for this module, opened and tuned once.
+    Autocommit mode (isolation_level=None): batches use explicit BEGIN/COMMIT.
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+    cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+    atexit.register(conn.close)
+    return conn
 
 
-# ----------------- SQLite setup -----------------
 def init_scored_table():
     """Create scored_candidates table if not exists."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = _get_conn()
     cur = conn.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS scored_candidates (
@@ -66,18 +118,16 @@ def init_scored_table():
         explanation TEXT
     )
     """)
-    conn.commit()
-    conn.close()
+    # ordered top-K reads (ORDER BY final_score DESC LIMIT k) and per-POI lookups/dedup joins
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_scored_final_score ON scored_candidates(final_score DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_scored_poi ON scored_candidates(poi_id)")
     log.info("✅ scored_candidates table ensured in DB.")
 
 
 def clear_scored_candidates():
     """Optional: clear table to avoid duplicates across runs."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    cur = _get_conn().cursor()
     cur.execute("DELETE FROM scored_candidates")
-    conn.commit()
-    conn.close()
     log.info("🧹 cleared scored_candidates table.")
 
 
@@ -86,88 +136,128 @@ def save_scored_candidates(reranked: List[Dict[str, Any]]):
     if not reranked:
         log.warning("No candidates to save.")
         return
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.executemany("""
-    INSERT INTO scored_candidates 
-    (poi_id, city, country, type, semantic, distance, category_score, diversity_score, final_score, explanation)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, [
-        (
-            r.get("poi_id"), r.get("city"), r.get("country"), r.get("type"),
-            r.get("semantic"), r.get("distance"), r.get("category_score"),
-            r.get("diversity_score"), r.get("final_score"), r.get("explanation")
-        )
-        for r in reranked
-    ])
-    conn.commit()
-    conn.close()
+    # the whole batch is one transaction; rows are streamed from a generator
+    conn = _get_conn()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(_INSERT_SQL, (
+            (
+                r.get("poi_id"), r.get("city"), r.get("country"), r.get("type"),
+                r.get("semantic"), r.get("distance"), r.get("category_score"),
+                r.get("diversity_score"), r.get("final_score"), r.get("explanation")
+            )
+            for r in reranked
+        ))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
     log.info(f"💾 Saved {len(reranked)} scored candidates into DB")
 
 
 # ----------------- Core scoring -----------------
-def score_items(candidates: List[Dict[str, Any]], user_ctx: Dict[str, Any], weights: Dict[str, float]) -> List[Dict[str, Any]]:
+def score_items(candidates: List[Dict[str, Any]], user_ctx: Dict[str, Any], weights: Dict[str, float],
+                top_k: Optional[int] = None) -> List[Dict[str, Any]]:
     """
-    Compute weighted scores for candidates and return reranked list.
+    Compute weighted scores for candidates and return reranked list
+    (only the best `top_k` when given).
 
     Expected candidate keys from generators:
       - semantic candidates: 'semantic' + metadata  (from Candidates.get_candidates)
       - geo candidates: 'distance_km' + metadata    (from Candidates.geo_candidates)
       - popularity candidates: 'rank' + metadata    (from Candidates.popularity_candidates)
     """
-    # prepare ranges
-    sem_vals = [c.get("semantic", 0.0) for c in candidates if "semantic" in c]
-    sem_min, sem_max = (min(sem_vals), max(sem_vals)) if sem_vals else (0.0, 1.0)
-
-    dist_vals = [c.get("distance_km", 0.0) for c in candidates if "distance_km" in c]
-    dist_min, dist_max = (min(dist_vals), max(dist_vals)) if dist_vals else (0.0, 1.0)
-
-    reranked = []
-    selected_for_div = []
-
-    for c in candidates:
-        semantic_raw = c.get("semantic", 0.0)
-        semantic_norm = normalize_score(semantic_raw, sem_min, sem_max) if sem_vals else 0.5
+    n = len(candidates)
+    if n == 0:
+        return []
+
+    # SoA: a single pass over the candidates fills every per-field array,
+    # then everything below is vectorized
+    sem = np.zeros(n)
+    has_sem = np.zeros(n, dtype=bool)
+    dist = np.zeros(n)
+    has_dist = np.zeros(n, dtype=bool)
+    cats = np.empty(n, dtype=np.int64)
+    type_codes: Dict[str, int] = {}
+    for i, c in enumerate(candidates):
+        if "semantic" in c:
+            sem[i] = c["semantic"]
+            has_sem[i] = True
+        d = c.get("distance_km")
+        if d is not None:
+            dist[i] = d
+            has_dist[i] = True
+        # int-encode the lowercased category (-1 = no type)
+        t = (c.get("type") or "").lower()
+        cats[i] = type_codes.setdefault(t, len(type_codes)) if t else -1
+
+    if has_sem.any():
+        s = sem[has_sem]
+        semantic_norm = normalize_scores(sem, float(s.min()), float(s.max()))
+    else:
+        semantic_norm = np.full(n, 0.5)
+
+    # nearer is better -> invert normalized distance
+    distance_norm = np.full(n, 0.5)
+    if has_dist.any():
+        d = dist[has_dist]
+        distance_norm[has_dist] = 1 - normalize_scores(d, float(d.min()), float(d.max()))
+
+    # category: 1.0 if the POI type matches a user interest (case-insensitive), else 0
+    interests_lc = frozenset(x.lower() for x in user_ctx.get("interests", []) if x)
+    is_interest = np.fromiter((t in interests_lc for t in type_codes), dtype=bool, count=len(type_codes))
+
+    # diversity: -0.2 per earlier candidate of the same category
+    category_score, diversity_score, final_score = _score_kernel(
+        semantic_norm, distance_norm, cats, is_interest,
+        weights.get("semantic", 0.5), weights.get("distance", 0.3),
+        weights.get("category", 0.15), weights.get("diversity", 0.05)
+    )
 
-        # nearer is better -> invert normalized distance
-        distance_raw = c.get("distance_km", None)
-        if distance_raw is None or not dist_vals:
-            distance_norm = 0.5
+    # order on the rounded score (ties keep input order), as the stored/returned values are rounded
+    key = -np.round(final_score, 3)
+    if top_k is not None and top_k < n:
+        # partial selection: O(N) partition + O(K log K) sort of the winners;
+        # everything tied with the k-th score is kept so tie-breaking matches the full sort
+        if top_k > 0:
+            kth = key[np.argpartition(key, top_k - 1)[top_k - 1]]
+            idx = np.flatnonzero(key <= kth)
         else:
-            distance_norm = 1 - normalize_score(distance_raw, dist_min, dist_max)
-
-        category_score = category_match(c.get("type"), user_ctx.get("interests", []))
-        diversity_score = diversity_penalty(selected_for_div, c.get("type"))
+            idx = np.empty(0, dtype=np.intp)
+        order = idx[np.lexsort((idx, key[idx]))][:top_k]
+    else:
+        order = np.argsort(key, kind="stable")
 
-        final_score = (
-            weights.get("semantic", 0.5) * semantic_norm +
-            weights.get("distance", 0.3) * distance_norm +
-            weights.get("category", 0.15) * category_score +
-            weights.get("diversity", 0.05) * diversity_score
-        )
+    # round whole score vectors once instead of per-row round(float(x)) calls;
+    # the explanation keeps formatting the unrounded values
+    sem_o, dist_o, cat_o, div_o = (a[order] for a in (semantic_norm, distance_norm, category_score, diversity_score))
+    rounded = zip(*(np.round(a, 3).tolist() for a in (sem_o, dist_o, cat_o, div_o, final_score[order])))
+    raw = zip(sem_o.tolist(), dist_o.tolist(), cat_o.tolist(), div_o.tolist())
 
-        item = {
+    reranked = []
+    for i, (sem_r, dist_r, cat_r, div_r, final_r), (sem_v, dist_v, cat_v, div_v) in zip(order.tolist(), rounded, raw):
+        c = candidates[i]
+        reranked.append({
             "poi_id": c.get("poi_id"),
             "city": c.get("city"),
             "country": c.get("country"),
             "type": c.get("type"),
-            "semantic": round(float(semantic_norm), 3),
-            "distance": round(float(distance_norm), 3),
-            "category_score": round(float(category_score), 3),
-            "diversity_score": round(float(diversity_score), 3),
-            "final_score": round(float(final_score), 3),
-            "explanation": f"sem:{semantic_norm:.2f}, dist:{distance_norm:.2f}, cat:{category_score:.2f}, div:{diversity_score:.2f}"
-        }
-        reranked.append(item)
-        selected_for_div.append({"type": c.get("type")})
+            "semantic": sem_r,
+            "distance": dist_r,
+            "category_score": cat_r,
+            "diversity_score": div_r,
+            "final_score": final_r,
+            "explanation": f"sem:{sem_v:.2f}, dist:{dist_v:.2f}, cat:{cat_v:.2f}, div:{div_v:.2f}"
+        })
 
-    return sorted(reranked, key=lambda x: x["final_score"], reverse=True)
+    return reranked
 
 
-def rerank(candidates: List[Dict[str, Any]], user_ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+def rerank(candidates: List[Dict[str, Any]], user_ctx: Dict[str, Any],
+           top_k: Optional[int] = None) -> List[Dict[str, Any]]:
     """Wrapper with default weights for reranking."""
     default_weights = {"semantic": 0.5, "distance": 0.3, "category": 0.15, "diversity": 0.05}
-    return score_items(candidates, user_ctx, default_weights)
+    return score_items(candidates, user_ctx, default_weights, top_k=top_k)
 
 
 # ----------------- Smoke Test -----------------
@@ -196,7 +286,7 @@ if __name__ == "__main__":
     # Merge unique candidates by poi_id (semantic wins on ties)
     merged_by_id = {}
     for src in (pop_cands + geo_cands + semantic_cands):
-        merged_by_id[src["poi_id"]] = {**merged_by_id.get(src["poi_id"], {}), **src}
+        merged_by_id.setdefault(src["poi_id"], {}).update(src)
     merged = list(merged_by_id.values())
 
     # Rerank
@@ -0,0 +1 @@
+"""TourPlan recommender package: POI preprocessing, scoring and itinerary building."""
@@ -0,0 +1,21 @@
+"""
+_model.py
+---------------
+Shared SentenceTransformer loader so Candidates.py and Features.py
+reuse one copy of the model weights per process.
+"""
+import logging
+from functools import lru_cache
+
+DEFAULT_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+log = logging.getLogger("model")
+
+
+@lru_cache(maxsize=1)
+def get_st_model(name: str = DEFAULT_MODEL, device: str = "cpu"):
+    """Load the SentenceTransformer on first use and return the cached instance afterwards."""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(name, device=device)
+    log.info(f"✅ Loaded {name} model.")
+    return model
@@ -6,88 +6,192 @@ Fetches all POI data from database and creates comprehensive lookup system
 
 import sqlite3
 import logging
-from typing import Dict, List, Any, Tuple
-from collections import defaultdict
+import atexit
+import sys
+import glob
+import pickle
+from functools import lru_cache
+from typing import Dict, List, Any, Tuple, Set, Iterable
+from collections import defaultdict, namedtuple
 import os
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "poi.db")
+CACHE_PREFIX = "poi_preproc"
+FETCH_BATCH_SIZE = 10_000
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("data_preprocessor")
 
+@lru_cache(maxsize=1)
+def _get_conn() -> sqlite3.Connection:
+    """Shared, tuned read connection (opened once, closed at exit)"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+    atexit.register(conn.close)
+    return conn
+
+def _build_trigram_index(values: Iterable[str]) -> Dict[str, Set[str]]:
+    """Map every 3-char substring to the set of values containing it"""
+    index = defaultdict(set)
+    for value in values:
+        for i in range(len(value) - 2):
+            index[value[i:i + 3]].add(value)
+    return index
+
+def _fuzzy_keys(query: str, keys: Set[str], trigrams: Dict[str, Set[str]]) -> Set[str]:
+    """Keys that contain the query, or are contained in it"""
+    # keys inside the query: probe each substring of the (short) query
+    matches = {query[i:j] for i in range(len(query)) for j in range(i + 1, len(query) + 1)} & keys
+    
+    # keys containing the query: only values sharing all of its trigrams can match
+    if len(query) < 3:
+        candidates = keys
+    else:
+        buckets = sorted((trigrams.get(query[i:i + 3], set()) for i in range(len(query) - 2)), key=len)
+        candidates = buckets[0].intersection(*buckets[1:])
+    matches.update(k for k in candidates if query in k)
+    return matches
+
+def _cache_path(lang: str) -> str:
+    """Pickle cache path for the preprocessed lookups, keyed by lang + DB mtime/size"""
+    # in WAL mode new writes land in the -wal file first, so include it too;
+    # nanosecond mtimes plus sizes catch writes within the same second
+    stamp = []
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        if os.path.exists(path):
+            st = os.stat(path)
+            stamp.append(f"{st.st_mtime_ns}_{st.st_size}")
+        else:
+            stamp.append("0_0")
+    return os.path.join(os.path.dirname(DB_PATH), f"{CACHE_PREFIX}_{lang}_{'_'.join(stamp)}.pkl")
+
+# Compact immutable POI record (tuple-sized, no per-row dict)
+POI = namedtuple("POI", "poi_id name type description city country city_lower country_lower")
+
 class POIDataPreprocessor:
     """Preprocesses and stores all POI data for fast lookup"""
     
     def __init__(self):
-        self.all_pois: List[Dict] = []
-        self.city_country_lookup: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
-        self.city_lookup: Dict[str, List[Dict]] = defaultdict(list)
-        self.country_lookup: Dict[str, List[Dict]] = defaultdict(list)
+        self.all_pois: List[POI] = []
+        self.city_country_lookup: Dict[Tuple[str, str], List[POI]] = defaultdict(list)
+        self.city_lookup: Dict[str, List[POI]] = defaultdict(list)
+        self.country_lookup: Dict[str, List[POI]] = defaultdict(list)
         self.available_locations: List[Tuple[str, str, int]] = []
+        self.city_trigrams: Dict[str, Set[str]] = {}
+        self.country_trigrams: Dict[str, Set[str]] = {}
         self.is_loaded = False
+        self.version = 0  # Bumped on every successful (re)load, for result caches keyed on the data
         
+    def _load_cache(self, cache_path: str) -> bool:
+        """Restore the lookup structures from a pickle cache, if present and readable"""
+        if not os.path.exists(cache_path):
+            return False
+        try:
+            with open(cache_path, "rb") as f:
+                (self.all_pois, self.city_country_lookup, self.city_lookup, self.country_lookup,
+                 self.available_locations, self.city_trigrams, self.country_trigrams) = pickle.load(f)
+            return True
+        except Exception as e:
+            log.warning(f"Ignoring unreadable cache {cache_path}: {e}")
+            return False
+    
+    def _save_cache(self, cache_path: str, lang: str):
+        """Pickle the lookup structures and drop stale caches for the same lang"""
+        try:
+            for stale in glob.glob(os.path.join(os.path.dirname(cache_path), f"{CACHE_PREFIX}_{lang}_*.pkl")):
+                os.remove(stale)
+            with open(cache_path, "wb") as f:
+                pickle.dump(
+                    (self.all_pois, self.city_country_lookup, self.city_lookup, self.country_lookup,
+                     self.available_locations, self.city_trigrams, self.country_trigrams),
+                    f, protocol=5
+                )
+        except Exception as e:
+            log.warning(f"Could not write cache {cache_path}: {e}")
+    
     def load_all_data(self, lang: str = "en") -> bool:
         """Load all POI data from database and create lookup structures"""
         try:
+            # Warm start: reuse the pickled structures while the DB is unchanged
+            cache_path = _cache_path(lang)
+            if self._load_cache(cache_path):
+                self.is_loaded = True
+                self.version += 1
+                log.info(f"Loaded {len(self.all_pois)} POIs from {len(self.available_locations)} locations (cache)")
+                return True
+            
             log.info("Loading all POI data from database...")
-            conn = sqlite3.connect(DB_PATH)
-            cur = conn.cursor()
+            cur = _get_conn().cursor()
             
             # Fetch all POIs with their text data
             cur.execute("""
                 SELECT p.id, pt.name, p.type, pt.description, p.city_name, p.country_name
                 FROM pois p
                 LEFT JOIN poi_texts pt ON p.id = pt.poi_id AND pt.lang=?
+                WHERE p.city_name IS NOT NULL AND p.city_name != ''
+                  AND p.country_name IS NOT NULL AND p.country_name != ''
                 ORDER BY p.city_name, p.country_name, p.id
             """, (lang,))
             
-            rows = cur.fetchall()
-            conn.close()
-            
-            if not rows:
-                log.error("No data found in database")
-                return False
-            
-            # Process all POIs
+            # Process all POIs, streaming rows in batches instead of one fetchall()
             self.all_pois = []
-            for poi_id, name, raw_type, desc, city_name, country_name in rows:
-                if not city_name or not country_name:
-                    continue
+            while True:
+                rows = cur.fetchmany(FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                for poi_id, name, raw_type, desc, city_name, country_name in rows:
+                    # city/country strings repeat across thousands of rows: intern them
+                    city = sys.intern(city_name.strip())
+                    country = sys.intern(country_name.strip())
+                    city_key = sys.intern(city_name.lower().strip())
+                    country_key = sys.intern(country_name.lower().strip())
+                    
+                    poi_data = POI(
+                        poi_id,
+                        name or "Unknown",
+                        raw_type or "other",
+                        desc or "",
+                        city,
+                        country,
+                        city_key,
+                        country_key
+                    )
                     
-                poi_data = {
-                    "poi_id": poi_id,
-                    "name": name or "Unknown",
-                    "type": raw_type or "other",
-                    "description": desc or "",
-                    "city": city_name.strip(),
-                    "country": country_name.strip(),
-                    "city_lower": city_name.lower().strip(),
-                    "country_lower": country_name.lower().strip()
-                }
-                
-                self.all_pois.append(poi_data)
-                
-                # Create lookup structures
-                city_key = city_name.lower().strip()
-                country_key = country_name.lower().strip()
-                city_country_key = (city_key, country_key)
-                
-                self.city_country_lookup[city_country_key].append(poi_data)
-                self.city_lookup[city_key].append(poi_data)
-                self.country_lookup[country_key].append(poi_data)
+                    self.all_pois.append(poi_data)
+                    
+                    # Create lookup structures
+                    self.city_country_lookup[(city_key, country_key)].append(poi_data)
+                    self.city_lookup[city_key].append(poi_data)
+                    self.country_lookup[country_key].append(poi_data)
             
-            # Create available locations list
-            location_counts = defaultdict(int)
-            for poi in self.all_pois:
-                key = (poi["city"], poi["country"])
-                location_counts[key] += 1
+            if not self.all_pois:
+                log.error("No data found in database")
+                return False
             
+            # Create available locations list (grouped and counted by SQLite)
+            cur.execute("""
+                SELECT TRIM(city_name), TRIM(country_name), COUNT(*)
+                FROM pois
+                WHERE city_name IS NOT NULL AND city_name != ''
+                  AND country_name IS NOT NULL AND country_name != ''
+                GROUP BY TRIM(city_name), TRIM(country_name)
+                ORDER BY COUNT(*) DESC, TRIM(city_name), TRIM(country_name)
+            """)
             self.available_locations = [
-                (city, country, count) 
-                for (city, country), count in location_counts.items()
+                (sys.intern(city), sys.intern(country), count)
+                for city, country, count in cur
             ]
-            self.available_locations.sort(key=lambda x: x[2], reverse=True)
+            
+            # Trigram indexes over the unique city/country keys for fuzzy lookup
+            self.city_trigrams = _build_trigram_index(self.city_lookup)
+            self.country_trigrams = _build_trigram_index(self.country_lookup)
             
             self.is_loaded = True
+            self.version += 1
+            self._save_cache(cache_path, lang)
             log.info(f"Loaded {len(self.all_pois)} POIs from {len(self.available_locations)} locations")
             
             # Log top locations for debugging
@@ -101,7 +205,7 @@ class POIDataPreprocessor:
             log.error(f"Error loading data: {e}")
             return False
     
-    def find_pois_for_location(self, city: str, country: str) -> List[Dict]:
+    def find_pois_for_location(self, city: str, country: str) -> List[POI]:
         """Find POIs for a specific city/country with fuzzy matching"""
         if not self.is_loaded:
             log.warning("Data not loaded, attempting to load...")
@@ -130,14 +234,14 @@ class POIDataPreprocessor:
             log.info(f"Found {len(pois)} POIs for country match: {country}")
             return pois
         
-        # Try fuzzy matching
+        # Try fuzzy matching (substring either way) on the unique city/country keys
+        fuzzy_cities = _fuzzy_keys(city_clean, set(self.city_lookup), self.city_trigrams)
+        fuzzy_countries = _fuzzy_keys(country_clean, set(self.country_lookup), self.country_trigrams)
+        
         fuzzy_matches = []
-        for poi in self.all_pois:
-            city_match = city_clean in poi["city_lower"] or poi["city_lower"] in city_clean
-            country_match = country_clean in poi["country_lower"] or poi["country_lower"] in country_clean
-            
-            if city_match or country_match:
-                fuzzy_matches.append(poi)
+        for (city_key, country_key), pois in self.city_country_lookup.items():
+            if city_key in fuzzy_cities or country_key in fuzzy_countries:
+                fuzzy_matches.extend(pois)
         
         if fuzzy_matches:
             log.info(f"Found {len(fuzzy_matches)} POIs for fuzzy match: {city}, {country}")
@@ -177,7 +281,7 @@ def initialize_data():
     """Initialize the data preprocessor"""
     return preprocessor.load_all_data()
 
-def get_pois_for_location(city: str, country: str) -> List[Dict]:
+def get_pois_for_location(city: str, country: str) -> List[POI]:
     """Get POIs for a specific location"""
     return preprocessor.find_pois_for_location(city, country)
 
@@ -189,6 +293,10 @@ def get_location_suggestions(partial_city: str = "", partial_country: str = "")
     """Get location suggestions"""
     return preprocessor.get_location_suggestions(partial_city, partial_country)
 
+def get_data_version() -> int:
+    """Version of the loaded data (changes whenever it is reloaded)"""
+    return preprocessor.version
+
 if __name__ == "__main__":
     # Test the preprocessor
     log.info("Testing data preprocessor...")
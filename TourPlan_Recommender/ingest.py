@@ -4,27 +4,53 @@ ingest.py
 Fetches data from Trekio API and stores it into a database (SQLite by default).
 - Normalizes JSON structure (flattens nested descriptions).
 - Stores multilingual texts in a separate table.
-- Keeps raw JSON for reference/debugging.
+- Keeps raw JSON for reference/debugging (compressed, in a side table).
 - Exports a Parquet file for analytics.
 """
 """
 pre run these commands 
-pip install sqlalchemy requests
-python ingest.py
+pip install sqlalchemy requests pyarrow orjson zstandard   (orjson/zstandard optional)
+python ingest.py            (add --excel to also write pois_and_texts.xlsx)
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import zlib
+import sqlite3
 import logging
+from contextlib import closing
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from sqlalchemy import create_engine, Table, Column, Integer, String, Float, Text, MetaData, ForeignKey
-from sqlalchemy.exc import SQLAlchemyError
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, event, Table, Column, Integer, String, Float, Text, LargeBinary, MetaData, ForeignKey
+
+# Optional: faster JSON serialization, fallback to json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Optional: zstd for the raw JSON blobs, fallback to zlib
+try:
+    import zstandard as zstd
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
 #logging.basicConfig(level=logging.DEBUG)
 
 # ----------------- Configuration -----------------
 API_URL = "https://trekio.net/api/get-places-data"
 DB_URL = "sqlite:///poi.db"  # Can be switched to PostgreSQL later
 PARQUET_FILE = "pois.parquet"  # Path for Parquet export
+TEXTS_PARQUET_FILE = "poi_texts.parquet"
+EXCEL_FILE = "pois_and_texts.xlsx"  # Only written with --excel
+LANGS = ("en", "ar", "sq")  # Languages stored in poi_texts
+PREFETCH_PAGES = 4  # Pages fetched concurrently ahead of the page being inserted
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("ingest")
@@ -44,8 +70,7 @@ pois = Table(
     Column("latitude", Float),
     Column("longitude", Float),
     Column("location", Text),                # Google Maps link
-    Column("created_at", Text),
-    Column("raw_json", Text)                 # Full raw JSON stored as fallback
+    Column("created_at", Text)
 )
 
 # Multilingual text table
@@ -59,16 +84,60 @@ poi_texts = Table(
     Column("description", Text)
 )
 
+# Full raw JSON per POI, compressed, kept out of the main table as fallback
+raw_blobs = Table(
+    "raw_blobs", meta,
+    Column("poi_id", Integer, ForeignKey("pois.id"), primary_key=True),
+    Column("codec", String(8)),              # Compression of blob: zstd/zlib
+    Column("blob", LargeBinary)
+)
+
+# Arrow schemas for the Parquet export (streamed, one row group per ingested page)
+POIS_SCHEMA = pa.schema([
+    ("external_id", pa.int64()),
+    ("city_id", pa.int64()),
+    ("city_name", pa.string()),
+    ("country_name", pa.string()),
+    ("type", pa.string()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("location", pa.string()),
+    ("created_at", pa.string()),
+    ("db_id", pa.int64()),
+])
+
+TEXTS_SCHEMA = pa.schema([
+    ("poi_id", pa.int64()),
+    ("lang", pa.string()),
+    ("name", pa.string()),
+    ("short_description", pa.string()),
+    ("description", pa.string()),
+])
+
+# Low-cardinality columns worth dictionary-encoding (free text is left plain)
+POIS_DICT_COLUMNS = ["city_name", "country_name", "type"]
+TEXTS_DICT_COLUMNS = ["lang"]
+
+# Plain parameterized INSERTs for the ingest loop (SQLAlchemy only creates the schema)
+POI_COLUMNS = ("external_id", "city_id", "city_name", "country_name", "type",
+               "latitude", "longitude", "location", "created_at")
+TEXT_COLUMNS = ("poi_id", "lang", "name", "short_description", "description")
+INSERT_POI_SQL = f"INSERT INTO pois ({', '.join(POI_COLUMNS)}) VALUES ({', '.join('?' * len(POI_COLUMNS))})"
+INSERT_TEXT_SQL = f"INSERT INTO poi_texts ({', '.join(TEXT_COLUMNS)}) VALUES ({', '.join('?' * len(TEXT_COLUMNS))})"
+INSERT_BLOB_SQL = "INSERT INTO raw_blobs (poi_id, codec, blob) VALUES (?, ?, ?)"
+
 # ----------------- Helper Functions -----------------
-def check_existing_poi(conn, external_id: int) -> bool:
-    """Check if POI with given external_id already exists."""
-    try:
-        result = conn.execute(
-            pois.select().where(pois.c.external_id == external_id)
-        ).fetchone()
-        return result is not None
-    except Exception:
-        return False
+def _make_session() -> requests.Session:
+    """HTTP session shared by all page fetches: keep-alive pool sized for the prefetch window, backoff on 5xx."""
+    session = requests.Session()
+    # read timeouts are left to fetch_page's own retry loop
+    retry = Retry(total=3, read=0, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=PREFETCH_PAGES, pool_maxsize=PREFETCH_PAGES, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+SESSION = _make_session()
 
 def fetch_page(page: int = 1, max_retries: int = 3):
     """Fetch a single page of data from the Trekio API with retry logic."""
@@ -76,9 +145,9 @@ def fetch_page(page: int = 1, max_retries: int = 3):
     
     for attempt in range(max_retries):
         try:
-            resp = requests.get(url, timeout=15)
+            resp = SESSION.get(url, timeout=15)
             resp.raise_for_status()
-            data = resp.json()
+            data = _parse_json(resp)
             
             # Log page info
             if "data" in data:
@@ -104,6 +173,31 @@ def fetch_page(page: int = 1, max_retries: int = 3):
     
     return None
 
+def _parse_json(resp) -> dict:
+    """Decode a JSON response body, with orjson when available."""
+    if HAS_ORJSON:
+        try:
+            return orjson.loads(resp.content)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN literals, which json accepts
+    return resp.json()
+
+def _en(field):
+    """English value of a multilingual field; plain values are returned as-is."""
+    return field.get("en") if isinstance(field, dict) else field
+
+def _by_lang(field) -> dict:
+    """Normalize a multilingual field to {lang: value}: dicts as-is, a plain string applies to every language."""
+    if isinstance(field, dict):
+        return field
+    return dict.fromkeys(LANGS, field if isinstance(field, str) else None)
+
+def _raw_json_bytes(item) -> bytes:
+    """Serialize a raw API item to compact UTF-8 JSON bytes."""
+    if HAS_ORJSON:
+        return orjson.dumps(item)
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 def flatten_description(desc_field):
     """Flatten description field (handles dicts, lists, and strings)."""
     if not desc_field:
@@ -130,10 +224,28 @@ def flatten_description(desc_field):
         return " ".join([str(x) for x in desc_field if x])  
     return str(desc_field)
 
+def _tune_sqlite(engine):
+    """Bulk-load pragmas for SQLite connections (WAL, relaxed fsync, in-memory temp, ~200 MB page cache)."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA cache_size=-200000")
+        cur.close()
+
 # ----------------- Ingestion Logic -----------------
-def ingest_data(clear_existing: bool = False):
-    """Fetches all paginated data and stores normalized results into DB + Parquet."""
+def ingest_data(clear_existing: bool = False, excel: bool = False):
+    """
+    Fetches all paginated data and stores normalized results into DB + Parquet.
+    Parquet is written page by page; the Excel export (excel=True) needs all rows in memory.
+    """
     engine = create_engine(DB_URL, echo=False, future=True)
+    _tune_sqlite(engine)
     
     # Clear existing data if requested
     if clear_existing:
@@ -142,18 +254,52 @@ def ingest_data(clear_existing: bool = False):
     
     meta.create_all(engine)
 
-    all_pois = []       # Will be used for Parquet export
-    all_texts = []      # Will be used for Parquet export
-
-    with engine.begin() as conn:
+    # One compressor for the whole run (raw JSON blobs)
+    if HAS_ZSTD:
+        codec, compress = "zstd", zstd.ZstdCompressor(level=3).compress
+    else:
+        codec, compress = "zlib", zlib.compress
+
+    all_pois = []       # Only kept for the Excel export
+    all_texts = []      # Only kept for the Excel export
+
+    # Row tuples in INSERT column order, straight from the row dicts
+    poi_values = itemgetter(*POI_COLUMNS)
+    text_values = itemgetter(*TEXT_COLUMNS)
+
+    # Raw sqlite3 connection: the whole run is one transaction (committed on success, rolled back on error)
+    with (
+        closing(engine.raw_connection()) as raw_conn,
+        raw_conn.driver_connection as db,
+        ThreadPoolExecutor(max_workers=PREFETCH_PAGES) as pool,
+        pq.ParquetWriter(PARQUET_FILE, POIS_SCHEMA, compression="zstd",
+                         use_dictionary=POIS_DICT_COLUMNS) as pois_writer,
+        pq.ParquetWriter(TEXTS_PARQUET_FILE, TEXTS_SCHEMA, compression="zstd",
+                         use_dictionary=TEXTS_DICT_COLUMNS) as texts_writer,
+    ):
         inserted = 0
         page = 1
         max_pages = 1000  # Safety limit to prevent infinite loops
         consecutive_empty_pages = 0
         max_empty_pages = 3  # Stop after 3 consecutive empty pages
 
+        pending = {}  # page number -> future of its fetch_page()
+
+        # All known external_ids, loaded once: O(1) existence checks instead of a query per page/row
+        cur = db.cursor()
+        existing = {external_id for (external_id,) in cur.execute("SELECT external_id FROM pois")}
+
+        # Open the run's transaction explicitly: each page is a SAVEPOINT inside it, and releasing
+        # a savepoint that started the transaction would commit it page by page
+        if not db.in_transaction:
+            cur.execute("BEGIN")
+
         while page <= max_pages:
-            data = fetch_page(page)
+            # Keep the next PREFETCH_PAGES requests in flight so network I/O overlaps the DB inserts
+            for p in range(page, min(page + PREFETCH_PAGES, max_pages + 1)):
+                if p not in pending:
+                    pending[p] = pool.submit(fetch_page, p)
+            data = pending.pop(page).result()
             if not data or "data" not in data:
                 log.info(f"No data found on page {page} -> stopping.")
                 break
@@ -183,97 +329,102 @@ def ingest_data(clear_existing: bool = False):
             else:
                 consecutive_empty_pages = 0  # Reset counter
 
-            # Insert each POI record
+            poi_batch = []
+            new_items = []
+            page_ids = set()  # Joins `existing` only once the page is stored
             for item in iterable:
-                try:
-                    external_id = item.get("id")
-                    
-                    # Check if POI already exists
-                    if check_existing_poi(conn, external_id):
-                        log.debug(f"POI with external_id {external_id} already exists, skipping...")
-                        continue
-                    
-                    # Insert into pois table
-                    poi_row = {
-                        "external_id": external_id,
-                        "city_id": item.get("city_id"),
-                        "city_name": item.get("city_name", {}).get("en") if isinstance(item.get("city_name"), dict) else item.get("city_name"),
-                        "country_name": item.get("country_name", {}).get("en") if isinstance(item.get("country_name"), dict) else item.get("country_name"),
-                        "type": item.get("type"),
-                        "latitude": item.get("latitude"),
-                        "longitude": item.get("longitude"),
-                        "location": item.get("location"),
-                        "created_at": item.get("created_at"),
-                        "raw_json": json.dumps(item, ensure_ascii=False)
-                    }
-                    res = conn.execute(pois.insert().values(**poi_row))
-                    poi_id = res.inserted_primary_key[0]
-
-                    # Collect for Parquet export
-                    poi_row["db_id"] = poi_id
-                    all_pois.append(poi_row)
-
-                    # Insert multilingual texts
-                    for lang in ["en", "ar", "sq"]:
-                        nm = short = desc = None
-
-                        # Name
-                        if isinstance(item.get("name"), dict):
-                            nm = item["name"].get(lang)
-                        elif isinstance(item.get("name"), str):
-                            nm = item["name"]
-
-                        # Short description
-                        if isinstance(item.get("short_description"), dict):
-                            short = item["short_description"].get(lang)
-                        elif isinstance(item.get("short_description"), str):
-                            short = item["short_description"]
-
-                        # Long description
-                        desc_raw = None
-                        if isinstance(item.get("description"), dict):
-                            desc_raw = item["description"].get(lang)
-                        elif isinstance(item.get("description"), str):
-                            desc_raw = item["description"]
-
-                        desc = flatten_description(desc_raw)
-
-                        text_row = {
-                            "poi_id": poi_id,
-                            "lang": lang,
-                            "name": nm,
-                            "short_description": short,
-                            "description": desc
-                        }
-                        conn.execute(poi_texts.insert().values(**text_row))
-                        all_texts.append(text_row)
-
-                    inserted += 1
-
-                except SQLAlchemyError as e:
-                    log.error(f"Database insert error: {e}")
+                external_id = item.get("id")
+
+                # Check if POI already exists (in the DB, earlier in this run or on this page)
+                if external_id in existing or external_id in page_ids:
+                    log.debug(f"POI with external_id {external_id} already exists, skipping...")
                     continue
+                page_ids.add(external_id)
+
+                poi_batch.append({
+                    "external_id": external_id,
+                    "city_id": item.get("city_id"),
+                    "city_name": _en(item.get("city_name")),
+                    "country_name": _en(item.get("country_name")),
+                    "type": item.get("type"),
+                    "latitude": item.get("latitude"),
+                    "longitude": item.get("longitude"),
+                    "location": item.get("location"),
+                    "created_at": item.get("created_at")
+                })
+                new_items.append(item)
+
+            # Bulk insert the page: one executemany per table, all or nothing (savepoint per page)
+            if poi_batch:
+                cur.execute("SAVEPOINT page")
+                try:
+                    cur.executemany(INSERT_POI_SQL, map(poi_values, poi_batch))
+                    # We are the only writer in this transaction, so the page got consecutive
+                    # rowids ending at last_insert_rowid(), in poi_batch order
+                    last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    poi_ids = range(last_id - len(poi_batch) + 1, last_id + 1)
+
+                    text_batch = []
+                    blob_batch = []
+                    for poi_row, poi_id, item in zip(poi_batch, poi_ids, new_items):
+                        # Collect for Parquet export
+                        poi_row["db_id"] = poi_id
+
+                        # Multilingual texts: resolve dict-vs-string once per item, not per language
+                        names = _by_lang(item.get("name"))
+                        shorts = _by_lang(item.get("short_description"))
+                        descs = _by_lang(item.get("description"))
+                        for lang in LANGS:
+                            text_batch.append({
+                                "poi_id": poi_id,
+                                "lang": lang,
+                                "name": names.get(lang),
+                                "short_description": shorts.get(lang),
+                                "description": flatten_description(descs.get(lang))
+                            })
+                        blob_batch.append((poi_id, codec, compress(_raw_json_bytes(item))))
+                    cur.executemany(INSERT_TEXT_SQL, map(text_values, text_batch))
+                    cur.executemany(INSERT_BLOB_SQL, blob_batch)
+                except sqlite3.Error as e:
+                    # Drop the whole page (no orphan pois rows); its ids can come back on a later page
+                    cur.execute("ROLLBACK TO page")
+                    cur.execute("RELEASE page")
+                    log.error(f"Database insert error on page {page}: {e}")
+                else:
+                    cur.execute("RELEASE page")
+                    existing.update(page_ids)
+                    inserted += len(poi_batch)
+
+                    # Stream this page to Parquet; a page Arrow can't convert is left out of the
+                    # export only (its DB rows are kept), instead of aborting the whole run
+                    try:
+                        pois_rb = pa.RecordBatch.from_pylist(poi_batch, schema=POIS_SCHEMA)
+                        texts_rb = pa.RecordBatch.from_pylist(text_batch, schema=TEXTS_SCHEMA)
+                    except pa.ArrowException as e:
+                        log.error(f"Parquet export error on page {page}: {e}")
+                    else:
+                        pois_writer.write_batch(pois_rb)
+                        texts_writer.write_batch(texts_rb)
+                    if excel:
+                        all_pois.extend(poi_batch)
+                        all_texts.extend(text_batch)
 
             log.info(f"Finished page {page} with {record_count} records (Total inserted so far: {inserted})")
             page += 1  # Move to next page
 
         log.info(f"Total inserted: {inserted} POIs")
 
-    # ----------------- Export to Parquet -----------------
-    try:
-        df_pois = pd.DataFrame(all_pois)
-        df_texts = pd.DataFrame(all_texts)
-
-        with pd.ExcelWriter("pois_and_texts.xlsx") as writer:
-            df_pois.to_excel(writer, sheet_name="pois", index=False)
-            df_texts.to_excel(writer, sheet_name="poi_texts", index=False)
-
-        df_pois.to_parquet("pois.parquet", index=False)
-        df_texts.to_parquet("poi_texts.parquet", index=False)
+    log.info(f"Parquet export completed: {PARQUET_FILE} & {TEXTS_PARQUET_FILE}")
 
-        log.info(f"Parquet export completed: pois.parquet & poi_texts.parquet")
-    except Exception as e:
-        log.error(f"Failed to export Parquet: {e}")
+    # ----------------- Optional Excel export -----------------
+    if excel:
+        try:
+            with pd.ExcelWriter(EXCEL_FILE) as writer:
+                pd.DataFrame(all_pois).to_excel(writer, sheet_name="pois", index=False)
+                pd.DataFrame(all_texts).to_excel(writer, sheet_name="poi_texts", index=False)
+            log.info(f"Excel export completed: {EXCEL_FILE}")
+        except Exception as e:
+            log.error(f"Failed to export Excel: {e}")
 
 if __name__ == "__main__":
     import sys
@@ -288,4 +439,4 @@ if __name__ == "__main__":
             print("Operation cancelled.")
             sys.exit(0)
     
-    ingest_data(clear_existing=clear_existing)
+    ingest_data(clear_existing=clear_existing, excel="--excel" in sys.argv)
@@ -1,12 +1,22 @@
 import sqlite3
 import logging
 import random
-from datetime import datetime, timedelta
-import math
+import copy
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
 from typing import List, Dict, Any, Tuple
 
 import os
-from .data_preprocessor import initialize_data, get_pois_for_location, get_available_locations
+import numpy as np
+from .data_preprocessor import initialize_data, get_pois_for_location, get_available_locations, get_data_version, preprocessor
+
+# Optional: Aho-Corasick finds every theme keyword in one pass over the text
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "poi.db")
 logging.basicConfig(level=logging.INFO)
@@ -22,7 +32,23 @@ TOUR_THEMES = {
     'friends': {'keywords': ['bar','club','sports','fun','nightlife','escape room','bowling'], 'boost': 0.20},
 }
 
+def _build_theme_automaton():
+    """Keyword automaton: each keyword maps to the set of themes it signals."""
+    kw_themes: Dict[str, set] = {}
+    for theme, cfg in TOUR_THEMES.items():
+        for kw in cfg['keywords']:
+            kw_themes.setdefault(kw, set()).add(theme)
+    automaton = ahocorasick.Automaton()
+    for kw, themes in kw_themes.items():
+        automaton.add_word(kw, frozenset(themes))
+    automaton.make_automaton()
+    return automaton
+
+_THEME_AUTOMATON = _build_theme_automaton() if HAS_AHOCORASICK else None
+
 # ====== Category normalization ======
+# POI types come from a small vocabulary: memoize per raw type string
+@lru_cache(maxsize=2048)
 def normalize_category(raw_type: str) -> str:
     if not raw_type:
         return "other"
@@ -40,12 +66,23 @@ def classify_theme_text(text: str) -> List[str]:
     if not text:
         return []
     text_l = text.lower()
+    if _THEME_AUTOMATON is not None:
+        found = set()
+        for _, themes in _THEME_AUTOMATON.iter(text_l):
+            found |= themes
+        return [theme for theme in TOUR_THEMES if theme in found]  # keep TOUR_THEMES order
     hits = []
     for theme, cfg in TOUR_THEMES.items():
         if any(kw in text_l for kw in cfg['keywords']):
             hits.append(theme)
     return hits
 
+@lru_cache(maxsize=65536)
+def _poi_category_and_themes(poi) -> Tuple[str, Tuple[str, ...]]:
+    """Normalized category + themes of a preprocessed (immutable) POI, computed once per POI."""
+    base_type = normalize_category(poi.type)
+    return base_type, tuple(classify_theme_text(f"{base_type} {poi.name} {poi.description}"))
+
 # ====== Diversify while forcing exactly one hotel ======
 def select_with_hotel(candidates: List[Dict], plan_size:int=6, theme:str=None) -> List[Dict]:
     if plan_size < 2:
@@ -53,8 +90,7 @@ def select_with_hotel(candidates: List[Dict], plan_size:int=6, theme:str=None) -
 
     # pick best hotel
     hotels = [c for c in candidates if c["type"] == "hotel"]
-    hotels.sort(key=lambda x: x["score"], reverse=True)
-    hotel_pick = hotels[0] if hotels else None
+    hotel_pick = max(hotels, key=lambda x: x["score"]) if hotels else None
 
     selected: List[Dict] = []
     seen_ids = set()
@@ -65,26 +101,24 @@ def select_with_hotel(candidates: List[Dict], plan_size:int=6, theme:str=None) -
 
     pool = [c for c in candidates if c["poi_id"] not in seen_ids]
 
-    seen_types = {"hotel"} if hotel_pick else set()
-    def theme_score(c):
-        return 1 if (theme and theme in c.get("themes", [])) else 0
+    # running count of selected POIs per type (O(1) checks instead of rescanning `selected`)
+    type_counts = Counter({"hotel": 1} if hotel_pick else {})
 
-    pool.sort(key=lambda c: (theme_score(c), c["score"]), reverse=True)
+    # theme matches first, then by score (both descending, ties keep input order)
+    scores = np.fromiter((c["score"] for c in pool), dtype=np.float64, count=len(pool))
+    theme_hits = np.fromiter((bool(theme) and theme in c.get("themes", []) for c in pool), dtype=np.int8, count=len(pool))
+    pool = [pool[i] for i in np.lexsort((-scores, -theme_hits))]
 
     for c in pool:
         if len(selected) >= plan_size:
             break
         if c["poi_id"] in seen_ids:
             continue
-        if c["type"] not in seen_types:
+        # unseen type, or allow at most 1 duplicate type if short on slots
+        if type_counts[c["type"]] < 2:
             selected.append(c)
-            seen_types.add(c["type"])
+            type_counts[c["type"]] += 1
             seen_ids.add(c["poi_id"])
-        else:
-            # allow at most 1 duplicate type if short on slots
-            if sum(1 for s in selected if s["type"] == c["type"]) < 2:
-                selected.append(c)
-                seen_ids.add(c["poi_id"])
 
     # fallback: no hotel -> add dummy
     if not any(s["type"] == "hotel" for s in selected):
@@ -107,51 +141,45 @@ def select_with_hotel(candidates: List[Dict], plan_size:int=6, theme:str=None) -
     return selected[:plan_size]
 
 # ====== Time tiling across full day ======
-def build_time_slots(start_time:str="09:00", end_time:str="22:00", n:int=6) -> List[Tuple[str,str]]:
+def _to_minutes(hhmm: str) -> int:
+    """'HH:MM' -> minutes since midnight."""
+    h, m = hhmm.split(":")
+    return int(h) * 60 + int(m)
+
+def _fmt_minutes(minutes: int) -> str:
+    """Minutes since midnight -> 'HH:MM' (24:00 wraps to 00:00)."""
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+# few distinct (start, end, n) combinations in practice: memoize, returning an immutable tuple
+@lru_cache(maxsize=128)
+def build_time_slots(start_time:str="09:00", end_time:str="22:00", n:int=6) -> Tuple[Tuple[str,str], ...]:
     """Build n time slots between start and end, aligned to :00 or :30 only."""
-    start = datetime.strptime(start_time, "%H:%M")
-    end = datetime.strptime(end_time, "%H:%M")
-
-    # Snap start to nearest half-hour down, end to nearest half-hour up
-    def snap_down(dt: datetime) -> datetime:
-        minute = 0 if dt.minute < 30 else 30
-        return dt.replace(minute=minute, second=0, microsecond=0)
-
-    def snap_up(dt: datetime) -> datetime:
-        if dt.minute == 0:
-            return dt.replace(second=0, microsecond=0)
-        if dt.minute <= 30:
-            return dt.replace(minute=30, second=0, microsecond=0)
-        dt2 = dt.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-        return dt2
-
-    start = snap_down(start)
-    end = snap_up(end)
-
-    total_minutes = max(0, int((end - start).total_seconds() // 60))
+    # Plain integer minutes: snap start down and end up to the nearest half-hour
+    start = _to_minutes(start_time) // 30 * 30
+    end = -(-_to_minutes(end_time) // 30) * 30
+
+    total_minutes = max(0, end - start)
     if n <= 0 or total_minutes == 0:
-        return []
+        return ()
 
     # Compute step and round up to the next 30-minute multiple
-    raw_step = math.ceil(total_minutes / n)
-    step = max(30, int(math.ceil(raw_step / 30) * 30))
+    raw_step = -(-total_minutes // n)
+    step = max(30, -(-raw_step // 30) * 30)
 
     slots: List[Tuple[str, str]] = []
     cur = start
     for i in range(n):
-        nxt = cur + timedelta(minutes=step)
+        nxt = cur + step
         if i == n - 1 or nxt > end:
             nxt = end
-        # Ensure both times are on :00 or :30
-        cur_str = cur.strftime("%H:%M")
-        nxt_str = nxt.strftime("%H:%M")
-        slots.append((cur_str, nxt_str))
+        slots.append((_fmt_minutes(cur), _fmt_minutes(nxt)))
         cur = nxt
         if cur >= end:
             break
+    end_str = _fmt_minutes(end)
     while len(slots) < n:
-        slots.append((end.strftime("%H:%M"), end.strftime("%H:%M")))
-    return slots[:n]
+        slots.append((end_str, end_str))
+    return tuple(slots[:n])
 
 # ====== Public API ======
 def build_itinerary(city: str = None, country: str = None, lang: str = "en",
@@ -159,11 +187,10 @@ def build_itinerary(city: str = None, country: str = None, lang: str = "en",
                     theme: str = None) -> Dict[str, Any]:
     log.info(f"Building itinerary for city={city}, country={country}, plan_size={plan_size}, theme={theme}")
 
-    # Initialize data preprocessor if not already done
-    if not hasattr(build_itinerary, '_data_initialized'):
+    # Initialize data preprocessor if not already done (e.g. at app startup)
+    if not preprocessor.is_loaded:
         log.info("Initializing data preprocessor...")
         if initialize_data():
-            build_itinerary._data_initialized = True
             log.info("Data preprocessor initialized successfully")
         else:
             log.error("Failed to initialize data preprocessor")
@@ -174,6 +201,14 @@ def build_itinerary(city: str = None, country: str = None, lang: str = "en",
                 "days": []
             }
 
+    # Same request on the same data -> same plan: serve it from the cache (a copy, callers may mutate it)
+    return copy.deepcopy(_compute_itinerary(city, country, lang, plan_size, start_time, end_time, theme,
+                                            get_data_version()))
+
+@lru_cache(maxsize=1024)
+def _compute_itinerary(city: str, country: str, lang: str, plan_size: int, start_time: str, end_time: str,
+                       theme: str, data_version: int) -> Dict[str, Any]:
+    """Build the plan from the loaded POI data; data_version only keys the cache."""
     # 🔹 Use preprocessed data to find POIs
     pois_data = get_pois_for_location(city, country)
     
@@ -191,26 +226,21 @@ def build_itinerary(city: str = None, country: str = None, lang: str = "en",
             "days": []
         }
 
-    # Process POIs into candidates
+    # Process POIs into candidates (category/themes come memoized per POI)
+    # boost لو فيه تطابق مع الـ theme المطلوب
+    boost = TOUR_THEMES[theme]["boost"] if theme in TOUR_THEMES else 0.0
     candidates = []
     for poi_data in pois_data:
-        base_type = normalize_category(poi_data["type"])
-        themes = classify_theme_text(f"{base_type} {poi_data['name']} {poi_data['description']}")
-        score = 1.0
-
-        # boost لو فيه تطابق مع الـ theme المطلوب
-        if theme and theme in themes:
-            score += TOUR_THEMES[theme]["boost"]
-
+        base_type, themes = _poi_category_and_themes(poi_data)
         candidates.append({
-            "poi_id": poi_data["poi_id"],
-            "name": poi_data["name"],
+            "poi_id": poi_data.poi_id,
+            "name": poi_data.name,
             "type": base_type,
-            "description": poi_data["description"],
-            "themes": themes,
-            "score": score,
-            "city": poi_data["city"],
-            "country": poi_data["country"]
+            "description": poi_data.description,
+            "themes": list(themes),
+            "score": 1.0 + boost if theme in themes else 1.0,
+            "city": poi_data.city,
+            "country": poi_data.country
         })
 
     if not candidates:
@@ -240,13 +270,18 @@ def build_itinerary(city: str = None, country: str = None, lang: str = "en",
 
     # 🔹 Enhanced selection: Better distribution across days
     selected = select_with_hotel(candidates, plan_size=total_needed, theme=theme)
-    selected.sort(key=lambda x: (0 if x["type"] == "hotel" else 1, -x["score"]))
+    # hotels first, then by score descending: partition instead of a two-key sort
+    by_score = itemgetter("score")
+    hotels = sorted((x for x in selected if x["type"] == "hotel"), key=by_score, reverse=True)
+    others = sorted((x for x in selected if x["type"] != "hotel"), key=by_score, reverse=True)
+    selected = hotels + others
 
     # Ensure we have enough places for all days
     if len(selected) < total_needed:
         selected_ids = {s.get("poi_id") for s in selected}
         remaining = [c for c in candidates if c.get("poi_id") not in selected_ids]
-        remaining.sort(key=lambda x: x.get("score", 0), reverse=True)
+        scores = np.fromiter((x.get("score", 0) for x in remaining), dtype=np.float64, count=len(remaining))
+        remaining = [remaining[i] for i in np.argsort(-scores, kind="stable")]
         
         # Add remaining places
         for c in remaining:
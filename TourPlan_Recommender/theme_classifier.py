@@ -1,11 +1,25 @@
 # itinerary.py
+import re
 import sqlite3
 import logging
-import random
-from datetime import datetime, timedelta
+import atexit
+import threading
+import time
+from functools import lru_cache
 from typing import List, Dict, Any, Tuple
 
+import numpy as np
+
+# Optional: numba compiles the diversified-selection loop, fallback to plain Python
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 DB_PATH = "poi.db"
+CANDIDATE_CACHE_TTL = 3600    # seconds a fetch_candidates result is reused
+CANDIDATE_CACHE_SIZE = 512    # max cached (city, country, lang, theme, limit) keys
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("itinerary")
 
@@ -18,96 +32,200 @@ TOUR_THEMES = {
     'couples': {'boost': 0.25},
     'friends': {'boost': 0.20},
 }
+# themes interned to small ints once: per-row theme checks are int compares, boosts an array lookup
+THEME_ID = {name: i for i, name in enumerate(TOUR_THEMES)}
+BOOSTS = np.array([TOUR_THEMES[name]["boost"] for name in TOUR_THEMES], dtype=np.float64)
+NO_THEME = -1  # no theme / a theme outside TOUR_THEMES
 
 # ====== Light type normalization ======
+# Checked in this order: the first category with a keyword anywhere in the type wins
+CATEGORY_KEYWORDS = [
+    ("hotel", ["hotel","resort","hostel","inn","lodg"]),
+    ("restaurant", ["restaurant","cafe","bar","pub","food","eat"]),
+    ("shop", ["shop","mall","market","store","boutique","bazaar"]),
+    ("tourist place", ["museum","nature","beach","park","tourist","monument","landmark","viewpoint","temple","mosque","church","castle"]),
+    ("entertainment", ["club","entertainment","nightlife"]),
+]
+
+# One compiled pattern: an anchored lookahead per category, tried in priority order, each followed
+# by an empty group so match.lastindex tells which category matched
+_CATEGORY_RE = re.compile(
+    "^(?:" + "|".join(f"(?=.*?(?:{'|'.join(map(re.escape, kws))}))()" for _, kws in CATEGORY_KEYWORDS) + ")",
+    re.S
+)
+
+# POI types come from a small vocabulary: memoize per raw type string
+@lru_cache(maxsize=2048)
 def normalize_category(raw_type: str) -> str:
     if not raw_type:
         return "other"
-    t = raw_type.lower()
-    if any(x in t for x in ["hotel","resort","hostel","inn","lodg"]): return "hotel"
-    if any(x in t for x in ["restaurant","cafe","bar","pub","food","eat"]): return "restaurant"
-    if any(x in t for x in ["shop","mall","market","store","boutique","bazaar"]): return "shop"
-    if any(x in t for x in ["museum","nature","beach","park","tourist","monument","landmark","viewpoint","temple","mosque","church","castle"]): 
-        return "tourist place"
-    if any(x in t for x in ["club","entertainment","nightlife"]): return "entertainment"
-    return "other"
+    m = _CATEGORY_RE.match(raw_type.lower())
+    return CATEGORY_KEYWORDS[m.lastindex - 1][0] if m else "other"
+
+# ====== One-time DB setup ======
+@lru_cache(maxsize=1)
+def ensure_indexes() -> None:
+    """Create the lookup indexes fetch_candidates relies on (runs once per process)."""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # matches the `city_name = ? COLLATE NOCASE AND country_name = ? COLLATE NOCASE` filter
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pois_city_country_nocase "
+                     "ON pois(city_name COLLATE NOCASE, country_name COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_poi_texts_lookup ON poi_texts(poi_id, lang)")
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        log.warning(f"Could not create indexes: {e}")
+
+@lru_cache(maxsize=1)
+def _get_conn() -> sqlite3.Connection:
+    """Shared read-only connection, opened and tuned once (closed at exit)."""
+    ensure_indexes()
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    cur = conn.cursor()
+    cur.execute("PRAGMA query_only=1")
+    cur.execute("PRAGMA mmap_size=268435456")  # memory-map up to 256 MB of the DB file
+    atexit.register(conn.close)
+    return conn
 
 # ====== Fetch POIs directly from DB (using theme column) ======
+# POI data is static between ingests: hot city/country lookups are answered from memory
+_candidate_cache: Dict[tuple, Tuple[float, List[Dict]]] = {}
+_candidate_cache_lock = threading.Lock()
+
 def fetch_candidates(city:str=None, country:str=None, lang:str="en", theme:str=None, limit:int=200) -> List[Dict]:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    key = ((city or "").lower(), (country or "").lower(), lang, theme, limit)
+    now = time.monotonic()
+    with _candidate_cache_lock:
+        hit = _candidate_cache.get(key)
+        if hit and now - hit[0] < CANDIDATE_CACHE_TTL:
+            return list(hit[1])
+
+    candidates = _query_candidates(city, country, lang, theme, limit)
+
+    with _candidate_cache_lock:
+        _candidate_cache.pop(key, None)
+        if len(_candidate_cache) >= CANDIDATE_CACHE_SIZE:
+            del _candidate_cache[next(iter(_candidate_cache))]  # oldest entry
+        _candidate_cache[key] = (now, candidates)
+    return list(candidates)
+
+def _query_candidates(city:str, country:str, lang:str, theme:str, limit:int) -> List[Dict]:
+    cur = _get_conn().cursor()
 
+    # boost لو theme المطلوب نفس اللي في DB
+    # SQLite orders by the boost (random tie-break) and returns only the best `limit` rows;
+    # the scores themselves are computed below from the interned theme ids
+    theme_id = THEME_ID.get(theme, NO_THEME)
+    boost = float(BOOSTS[theme_id]) if theme_id != NO_THEME else 0.0
     query = """
         SELECT p.id, pt.name, p.type, pt.description, p.city_name, p.country_name, pt.theme
         FROM pois p
         LEFT JOIN poi_texts pt ON p.id = pt.poi_id AND pt.lang=?
-        WHERE LOWER(p.city_name) = LOWER(?) AND LOWER(p.country_name) = LOWER(?)
+        WHERE p.city_name = ? COLLATE NOCASE AND p.country_name = ? COLLATE NOCASE
+        ORDER BY CASE WHEN pt.theme = ? THEN ? ELSE 0 END DESC, random()
         LIMIT ?
     """
-    cur.execute(query, (lang, city, country, limit))
+    cur.execute(query, (lang, city, country, theme, boost, limit))
     rows = cur.fetchall()
-    conn.close()
 
-    candidates = []
-    for r in rows:
-        poi_id, name, raw_type, desc, city_name, country_name, theme_db = r
-        base_type = normalize_category(raw_type)
-        score = 1.0
+    theme_ids = np.fromiter((THEME_ID.get(r[6], NO_THEME) for r in rows), dtype=np.int8, count=len(rows))
+    scores = 1.0 + (theme_ids == theme_id) * boost
 
-        # boost لو theme المطلوب نفس اللي في DB
-        if theme and theme_db == theme:
-            score += TOUR_THEMES[theme]["boost"]
-
-        candidates.append({
+    return [
+        {
             "poi_id": poi_id,
             "name": name or "Unknown",
-            "type": base_type,
+            "type": normalize_category(raw_type),
             "description": desc or "",
             "themes": [theme_db] if theme_db else [],
+            "theme_id": tid,
             "city": city_name,
             "country": country_name,
             "score": score
-        })
-
-    # shuffle to break ties
-    random.shuffle(candidates)
-    return candidates
+        }
+        for (poi_id, name, raw_type, desc, city_name, country_name, theme_db), tid, score
+        in zip(rows, theme_ids.tolist(), scores.tolist())
+    ]
 
 # ====== Diversify while forcing exactly one hotel ======
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _select_diverse(order, type_ids, id_codes, taken, type_counts, slots):
+        """
+        Indices of up to `slots` candidates, walked in `order`: skips POIs already taken
+        (by id code) and keeps at most 2 of each type code. Updates taken/type_counts in place.
+        """
+        picked = np.empty(slots, dtype=np.int64)
+        k = 0
+        for j in range(order.size):
+            if k >= slots:
+                break
+            i = order[j]
+            if taken[id_codes[i]]:
+                continue
+            t = type_ids[i]
+            if type_counts[t] < 2:
+                picked[k] = i
+                k += 1
+                type_counts[t] += 1
+                taken[id_codes[i]] = True
+        return picked[:k]
+else:
+    def _select_diverse(order, type_ids, id_codes, taken, type_counts, slots):
+        """Indices of up to `slots` candidates in `order`, at most 2 per type code, no repeated POI."""
+        picked = []
+        type_list, id_list = type_ids.tolist(), id_codes.tolist()
+        for i in order.tolist():
+            if len(picked) >= slots:
+                break
+            if taken[id_list[i]]:
+                continue
+            t = type_list[i]
+            if type_counts[t] < 2:
+                picked.append(i)
+                type_counts[t] += 1
+                taken[id_list[i]] = True
+        return np.array(picked, dtype=np.int64)
+
 def select_with_hotel(candidates: List[Dict], plan_size:int=6, theme:str=None) -> List[Dict]:
     if plan_size < 2:
         plan_size = 2
 
-    # pick best hotel
-    hotels = [c for c in candidates if c["type"] == "hotel"]
-    hotels.sort(key=lambda x: x["score"], reverse=True)
-    hotel_pick = hotels[0] if hotels else None
+    # SoA view of the candidates: one pass each, then vectorized selection
+    n = len(candidates)
+    scores = np.fromiter((c["score"] for c in candidates), dtype=np.float64, count=n)
+    type_codes: Dict[str, int] = {}
+    type_ids = np.fromiter((type_codes.setdefault(c["type"], len(type_codes)) for c in candidates), dtype=np.int64, count=n)
+    theme_ids = np.fromiter((c.get("theme_id", NO_THEME) for c in candidates), dtype=np.int8, count=n)
+    wanted = THEME_ID.get(theme, NO_THEME)
+    theme_hits = theme_ids == wanted if wanted != NO_THEME else np.zeros(n, dtype=bool)
+    hotel_id = type_codes.get("hotel", -1)
 
-    selected: List[Dict] = []
-    seen_ids = set()
+    # pick best hotel (first one on ties)
+    hotel_mask = type_ids == hotel_id
+    hotel_idx = int(np.argmax(np.where(hotel_mask, scores, -np.inf))) if hotel_mask.any() else -1
+    hotel_pick = candidates[hotel_idx] if hotel_idx >= 0 else None
+
+    # repeated poi_ids share one id code, so a POI is taken at most once
+    _, id_codes = np.unique(np.fromiter((c["poi_id"] for c in candidates), dtype=np.int64, count=n),
+                            return_inverse=True)
+    taken = np.zeros(n, dtype=np.bool_)
+    # running count of selected POIs per type code (at most 2 of each)
+    type_counts = np.zeros(len(type_codes), dtype=np.int64)
 
+    selected: List[Dict] = []
     if hotel_pick:
         selected.append(hotel_pick)
-        seen_ids.add(hotel_pick["poi_id"])
-
-    pool = [c for c in candidates if c["poi_id"] not in seen_ids]
-
-    pool.sort(key=lambda c: (1 if (theme and theme in c.get("themes", [])) else 0, c["score"]), reverse=True)
+        taken[id_codes[hotel_idx]] = True
+        type_counts[hotel_id] = 1
 
-    seen_types = {"hotel"} if hotel_pick else set()
-    for c in pool:
-        if len(selected) >= plan_size:
-            break
-        if c["poi_id"] in seen_ids:
-            continue
-        if c["type"] not in seen_types:
-            selected.append(c)
-            seen_types.add(c["type"])
-            seen_ids.add(c["poi_id"])
-        else:
-            if sum(1 for s in selected if s["type"] == c["type"]) < 2:
-                selected.append(c)
-                seen_ids.add(c["poi_id"])
+    # theme matches first, then by score (ties keep input order); the hotel pick is skipped as taken
+    order = np.lexsort((-scores, ~theme_hits))
+    picked = _select_diverse(order, type_ids, id_codes.astype(np.int64), taken, type_counts,
+                             max(plan_size - len(selected), 0))
+    selected.extend(candidates[i] for i in picked.tolist())
 
     if not any(s["type"] == "hotel" for s in selected):
         selected.insert(0, {
@@ -128,24 +246,36 @@ def select_with_hotel(candidates: List[Dict], plan_size:int=6, theme:str=None) -
     return selected[:plan_size]
 
 # ====== Time tiling across full day ======
-def build_time_slots(start_time:str="09:00", end_time:str="22:00", n:int=6) -> List[Tuple[str,str]]:
-    start = datetime.strptime(start_time,"%H:%M")
-    end = datetime.strptime(end_time,"%H:%M")
-    total_minutes = int((end - start).total_seconds() // 60)
-    step = max(total_minutes // n, 30)
+def _to_minutes(hhmm: str) -> int:
+    """'HH:MM' -> minutes since midnight."""
+    h, m = hhmm.split(":")
+    return int(h) * 60 + int(m)
+
+def _fmt_minutes(minutes: int) -> str:
+    """Minutes since midnight -> 'HH:MM' (24:00 wraps to 00:00)."""
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+# few distinct (start, end, n) combinations in practice: memoize, returning an immutable tuple
+@lru_cache(maxsize=128)
+def build_time_slots(start_time:str="09:00", end_time:str="22:00", n:int=6) -> Tuple[Tuple[str,str], ...]:
+    # plain integer minutes since midnight instead of datetime/timedelta objects
+    start = _to_minutes(start_time)
+    end = _to_minutes(end_time)
+    step = max((end - start) // n, 30)
     slots = []
     cur = start
     for i in range(n):
-        nxt = cur + timedelta(minutes=step)
+        nxt = cur + step
         if i == n-1 or nxt > end:
             nxt = end
-        slots.append((cur.strftime("%H:%M"), nxt.strftime("%H:%M")))
+        slots.append((_fmt_minutes(cur), _fmt_minutes(nxt)))
         cur = nxt
         if cur >= end:
             break
+    end_hhmm = _fmt_minutes(end)
     while len(slots) < n:
-        slots.append((end.strftime("%H:%M"), end.strftime("%H:%M")))
-    return slots[:n]
+        slots.append((end_hhmm, end_hhmm))
+    return tuple(slots[:n])
 
 # ====== Public API ======
 def build_itinerary(city: str = None, country: str = None, lang: str = "en",
@@ -5,11 +5,18 @@ Simple script to view SQLite database contents
 """
 
 import sqlite3
-import pandas as pd
 import sys
 
 DB_PATH = "poi.db"
 
+def _print_rows(cursor, rows):
+    """Print rows as right-aligned fixed-width columns, headed by the cursor's column names."""
+    header = [d[0] for d in cursor.description]
+    cells = [[str(v) for v in row] for row in rows]
+    widths = [max([len(h), *(len(r[i]) for r in cells)]) for i, h in enumerate(header)]
+    for line in [header] + cells:
+        print(" ".join(v.rjust(w) for v, w in zip(line, widths)))
+
 def view_database():
     """View database contents in a readable format."""
     try:
@@ -32,9 +39,9 @@ def view_database():
             
             # Show sample data
             if count > 0:
-                df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT 3", conn)
+                cursor.execute(f"SELECT * FROM {table_name} LIMIT 3")
                 print(f"    Sample data:")
-                print(df.to_string(index=False))
+                _print_rows(cursor, cursor.fetchall())
                 print()
         
         conn.close()
@@ -64,9 +71,9 @@ def view_table(table_name: str, limit: int = 10):
         print()
         
         # Get data
-        df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT {limit}", conn)
+        cursor.execute(f"SELECT * FROM {table_name} LIMIT ?", (limit,))
         print(f"Data (first {limit} rows):")
-        print(df.to_string(index=False))
+        _print_rows(cursor, cursor.fetchall())
         
         # Get total count
         cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
@@ -10,29 +10,47 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 import logging
+import logging.handlers
+import queue
+import sqlite3
+import atexit
 import sys
-import os
+from functools import lru_cache
+from itertools import count
 from datetime import datetime
 import traceback
 
-# Add the TourPlan_Recommender module to path
-sys.path.append(os.path.join(os.path.dirname(__file__), 'TourPlan_Recommender'))
+# Optional: orjson encodes the (large) itinerary responses much faster, fallback to stdlib json
+try:
+    import orjson  # noqa: F401  (required by ORJSONResponse)
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    DefaultResponse = JSONResponse
 
 try:
     from TourPlan_Recommender.itinerary import build_itinerary, TOUR_THEMES
+    from TourPlan_Recommender import data_preprocessor
 except ImportError as e:
     print(f"Import error: {e}")
     sys.exit(1)
 
-# Configure logging
+# Configure logging: request threads only format + enqueue records, a background listener thread
+# does the file/console I/O (force=True: the package modules already called basicConfig on import)
+_log_queue = queue.Queue(-1)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)],
+    force=True
+)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue,
+    logging.FileHandler('app.log'),
+    logging.StreamHandler(),
+    respect_handler_level=True
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)  # flushes queued records on shutdown
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
@@ -41,7 +59,8 @@ app = FastAPI(
     description="Intelligent travel planning API for generating personalized tour itineraries",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=DefaultResponse
 )
 
 # CORS middleware for mobile app integration
@@ -72,12 +91,12 @@ class ItineraryResponse(BaseModel):
     success: bool
     message: str
     data: Dict[str, Any]
-    timestamp: str
+    timestamp: datetime
     request_id: str
 
 class HealthResponse(BaseModel):
     status: str
-    timestamp: str
+    timestamp: datetime
     version: str
     database_status: str
 
@@ -85,21 +104,47 @@ class ErrorResponse(BaseModel):
     success: bool = False
     error: str
     message: str
-    timestamp: str
+    timestamp: datetime
     request_id: str
 
+@lru_cache(maxsize=1)
+def get_db_connection() -> sqlite3.Connection:
+    """Shared read-only DB connection for the API (opened once, closed at exit)"""
+    conn = sqlite3.connect("poi.db", check_same_thread=False)
+    conn.execute("PRAGMA query_only=1")
+    atexit.register(conn.close)
+    return conn
+
+# Load the POI lookup data once at startup instead of on every /locations call
+@app.on_event("startup")
+async def load_poi_data():
+    if not data_preprocessor.initialize_data():
+        logger.error("Failed to load POI data at startup; /locations will retry")
+
+# FastAPI keeps the generated schema in app.openapi_schema; build it once here (all routes are
+# registered by now) so no /docs or /openapi.json request pays for walking the models
+@app.on_event("startup")
+async def build_openapi_schema():
+    app.openapi()
+
+# Request ids: a per-process counter (cheap and, unlike id(), never reused)
+_request_ids = count(1)
+
+def next_request_id() -> str:
+    return str(next(_request_ids))
+
 # Global error handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    return DefaultResponse(
         status_code=500,
         content=ErrorResponse(
             error="INTERNAL_SERVER_ERROR",
             message="An unexpected error occurred",
-            timestamp=datetime.now().isoformat(),
-            request_id=str(id(request))
-        ).dict()
+            timestamp=datetime.now(),
+            request_id=next_request_id()
+        ).model_dump(mode="json")
     )
 
 # Health check endpoint
@@ -108,16 +153,13 @@ async def health_check():
     """Health check endpoint for monitoring"""
     try:
         # Test database connection
-        import sqlite3
-        conn = sqlite3.connect("poi.db")
-        cur = conn.cursor()
+        cur = get_db_connection().cursor()
         cur.execute("SELECT COUNT(*) FROM pois")
         count = cur.fetchone()[0]
-        conn.close()
         
         return HealthResponse(
             status="healthy",
-            timestamp=datetime.now().isoformat(),
+            timestamp=datetime.now(),
             version="1.0.0",
             database_status=f"connected ({count} POIs)"
         )
@@ -125,38 +167,41 @@ async def health_check():
         logger.error(f"Health check failed: {e}")
         return HealthResponse(
             status="unhealthy",
-            timestamp=datetime.now().isoformat(),
+            timestamp=datetime.now(),
             version="1.0.0",
             database_status="disconnected"
         )
 
+@lru_cache(maxsize=1)
+def _locations_payload(data_version: int) -> List[Dict[str, Any]]:
+    """Location list (one GROUP BY, done at data load) as response dicts, rebuilt only when the data is reloaded"""
+    return [
+        {
+            "city": city,
+            "country": country,
+            "poi_count": count
+        }
+        for city, country, count in data_preprocessor.preprocessor.available_locations
+    ]
+
 # Get available locations
 @app.get("/locations")
 async def get_available_locations():
     """Get list of available cities and countries with POI counts"""
     try:
-        from TourPlan_Recommender.data_preprocessor import initialize_data, get_available_locations
-        
-        # Initialize data if not already done
-        if not initialize_data():
+        # Data is loaded at startup; retry only if that failed
+        if not data_preprocessor.preprocessor.is_loaded and not data_preprocessor.initialize_data():
             return {
                 "success": False,
                 "message": "Failed to load location data",
                 "locations": []
             }
         
-        locations = get_available_locations()
+        locations = _locations_payload(data_preprocessor.get_data_version())
         return {
             "success": True,
             "message": f"Found {len(locations)} locations",
-            "locations": [
-                {
-                    "city": city,
-                    "country": country,
-                    "poi_count": count
-                }
-                for city, country, count in locations
-            ]
+            "locations": locations
         }
     except Exception as e:
         logger.error(f"Error getting locations: {e}")
@@ -167,10 +212,12 @@ async def get_available_locations():
         }
 
 # Main itinerary generation endpoint
-@app.post("/itinerary", response_model=ItineraryResponse)
+# the response is built here, so it is serialized straight into a DefaultResponse: no model
+# validation and no jsonable_encoder pass; ItineraryResponse only documents the 200 response
+@app.post("/itinerary", responses={200: {"model": ItineraryResponse}})
 async def generate_itinerary(request: ItineraryRequest):
     """Generate a personalized travel itinerary"""
-    request_id = str(id(request))
+    request_id = next_request_id()
     
     try:
         logger.info(f"Generating itinerary for {request.city}, {request.country}")
@@ -191,13 +238,13 @@ async def generate_itinerary(request: ItineraryRequest):
         has_days = isinstance(result, dict) and bool(result.get("days"))
         has_slots = isinstance(result, dict) and bool(result.get("slots"))
         if not (has_days or has_slots):
-            return ItineraryResponse(
-                success=False,
-                message=f"No places found for {request.city}, {request.country}",
-                data={"days": []},
-                timestamp=datetime.now().isoformat(),
-                request_id=request_id
-            )
+            return DefaultResponse(content={
+                "success": False,
+                "message": f"No places found for {request.city}, {request.country}",
+                "data": {"days": []},
+                "timestamp": datetime.now().isoformat(),
+                "request_id": request_id
+            })
         
         # Build message
         if has_days:
@@ -207,13 +254,13 @@ async def generate_itinerary(request: ItineraryRequest):
         else:
             msg = f"Generated {len(result['slots'])} activities for {request.city}"
 
-        return ItineraryResponse(
-            success=True,
-            message=msg,
-            data=result,
-            timestamp=datetime.now().isoformat(),
-            request_id=request_id
-        )
+        return DefaultResponse(content={
+            "success": True,
+            "message": msg,
+            "data": result,
+            "timestamp": datetime.now().isoformat(),
+            "request_id": request_id
+        })
         
     except Exception as e:
         logger.error(f"Error generating itinerary: {e}", exc_info=True)
@@ -229,7 +276,7 @@ async def quick_itinerary(
     country: str = Query(..., description="Country name")
 ):
     """Quick itinerary generation with query parameters"""
-    request_id = str(id(city + country))
+    request_id = next_request_id()
     
     try:
         result = build_itinerary(
@@ -246,7 +293,7 @@ async def quick_itinerary(
                 "success": False,
                 "message": f"No places found for {city}, {country}",
                 "data": {"days": []},
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": datetime.now(),
                 "request_id": request_id
             }
 
@@ -261,7 +308,7 @@ async def quick_itinerary(
             "success": True,
             "message": msg,
             "data": result,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": datetime.now(),
             "request_id": request_id
         }
         
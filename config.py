@@ -5,54 +5,61 @@ Centralized configuration for production deployment
 """
 
 import os
+from functools import lru_cache
 from typing import List, Optional
-from pydantic import BaseSettings, Field
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
-    """Application settings with environment variable support"""
+    """Application settings with environment variable support (env var = upper-cased field name)"""
     
     # Application
-    app_name: str = Field(default="AI Travel Planner", env="APP_NAME")
-    app_version: str = Field(default="1.0.0", env="APP_VERSION")
-    debug: bool = Field(default=False, env="DEBUG")
-    log_level: str = Field(default="INFO", env="LOG_LEVEL")
+    app_name: str = Field(default="AI Travel Planner")
+    app_version: str = Field(default="1.0.0")
+    debug: bool = Field(default=False)
+    log_level: str = Field(default="INFO")
     
     # Server
-    host: str = Field(default="0.0.0.0", env="HOST")
-    port: int = Field(default=8000, env="PORT")
-    workers: int = Field(default=4, env="WORKERS")
+    host: str = Field(default="0.0.0.0")
+    port: int = Field(default=8000)
+    workers: int = Field(default=4)
     
     # Database
-    database_path: str = Field(default="poi.db", env="DATABASE_PATH")
+    database_path: str = Field(default="poi.db")
     
     # Security
-    secret_key: str = Field(default="change-me-in-production", env="SECRET_KEY")
-    api_key: Optional[str] = Field(default=None, env="API_KEY")
+    secret_key: str = Field(default="change-me-in-production")
+    api_key: Optional[str] = Field(default=None)
     
     # CORS
-    allowed_origins: List[str] = Field(default=["*"], env="ALLOWED_ORIGINS")
-    allowed_methods: List[str] = Field(default=["GET", "POST", "PUT", "DELETE", "OPTIONS"], env="ALLOWED_METHODS")
-    allowed_headers: List[str] = Field(default=["*"], env="ALLOWED_HEADERS")
+    allowed_origins: List[str] = Field(default=["*"])
+    allowed_methods: List[str] = Field(default=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
+    allowed_headers: List[str] = Field(default=["*"])
     
     # Rate Limiting
-    rate_limit_per_minute: int = Field(default=60, env="RATE_LIMIT_PER_MINUTE")
-    rate_limit_burst: int = Field(default=100, env="RATE_LIMIT_BURST")
+    rate_limit_per_minute: int = Field(default=60)
+    rate_limit_burst: int = Field(default=100)
     
     # Monitoring
-    enable_metrics: bool = Field(default=True, env="ENABLE_METRICS")
-    log_file_path: str = Field(default="app.log", env="LOG_FILE_PATH")
+    enable_metrics: bool = Field(default=True)
+    log_file_path: str = Field(default="app.log")
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = False
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        case_sensitive=False,
+        extra="ignore"  # unrelated keys in .env (e.g. ENVIRONMENT) are skipped, as before
+    )
 
-# Global settings instance
-settings = Settings()
+# Settings are parsed and validated on first use, then shared
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
 
 # Validation
 def validate_settings():
     """Validate critical settings"""
+    settings = get_settings()
     if settings.secret_key == "change-me-in-production":
         raise ValueError("SECRET_KEY must be changed in production!")
     